@@ -0,0 +1,191 @@
+import gzip
+from datetime import datetime
+from flask import Blueprint, Response, current_app, jsonify, request, \
+    stream_with_context
+from models import Venue, Artist
+import queries
+import exporter
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+MAX_IDS = 100
+# bodies smaller than this are not worth a compression pass
+MIN_COMPRESS_SIZE = 500
+# Responses are compressed per request, so brotli runs at a quality that
+# costs about what gzip -6 does; the build in assets.py, which compresses
+# each file once, keeps quality 11.
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+
+class BadRequest(Exception):
+    pass
+
+
+@api_v1.errorhandler(BadRequest)
+def bad_request(error):
+    return jsonify({'error': str(error)}), 400
+
+
+def _jsonable(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return dict((k, _jsonable(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def _int_list(name, maximum):
+    raw = request.args.get(name)
+    if not raw:
+        return None
+    try:
+        values = [int(v) for v in raw.split(',') if v.strip()]
+    except ValueError:
+        raise BadRequest('%s must be a comma separated list of ids' % name)
+    if len(values) > maximum:
+        raise BadRequest('at most %d %s per request' % (maximum, name))
+    return values
+
+
+def _select_fields(items):
+    # ?fields=id,name keeps only those keys; unknown names are ignored
+    raw = request.args.get('fields')
+    if not raw:
+        return items
+    fields = set(f.strip() for f in raw.split(','))
+    return [dict((k, v) for k, v in item.items() if k in fields)
+            for item in items]
+
+
+def _limit():
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _list(model, serialize):
+    # Either a bulk fetch (?ids=) in one IN query, or a keyset page on id
+    # continued with ?after=<next_cursor>.
+    ids = _int_list('ids', MAX_IDS)
+    if ids is not None:
+        items = [serialize(row) for row in
+                 model.query.filter(model.id.in_(ids)).order_by(model.id)]
+        return jsonify({'data': _select_fields(_jsonable(items))})
+
+    limit = _limit()
+    query = model.query.order_by(model.id)
+    after = request.args.get('after', type=int)
+    if after is not None:
+        query = query.filter(model.id > after)
+    rows = query.limit(limit + 1).all()
+    items = [serialize(row) for row in rows[:limit]]
+    return jsonify({
+        'data': _select_fields(_jsonable(items)),
+        'next_cursor': rows[limit - 1].id if len(rows) > limit else None,
+    })
+
+
+def _detail(details):
+    if details is None:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify({'data': _select_fields([_jsonable(details)])[0]})
+
+#----------------------------------------------------------------------------#
+# Resources.
+#----------------------------------------------------------------------------#
+
+
+@api_v1.route('/venues')
+def venues():
+    return _list(Venue, Venue.get_json)
+
+
+@api_v1.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    return _detail(queries.cached_venue_details(
+        venue_id, parallel=current_app.config['DETAIL_FANOUT_ENABLED']))
+
+
+@api_v1.route('/artists')
+def artists():
+    return _list(Artist, Artist.info)
+
+
+@api_v1.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    return _detail(queries.cached_artist_details(
+        artist_id, parallel=current_app.config['DETAIL_FANOUT_ENABLED']))
+
+
+@api_v1.route('/shows')
+def shows():
+    after = queries.decode_cursor(request.args.get('after', ''))
+    before = queries.decode_cursor(request.args.get('before', ''))
+    page = queries.shows_page(
+        after=after, before=before, limit=_limit(),
+        from_view=current_app.config['MATERIALIZED_VIEWS_ENABLED'])
+    return jsonify({
+        'data': _select_fields(_jsonable(page['shows'])),
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor'],
+    })
+
+
+@api_v1.route('/export/<entity>')
+def export(entity):
+    # Streamed straight from a server-side cursor; parquet is CLI only since
+    # its footer can only be written once the whole file is known.
+    if entity not in exporter.ENTITIES:
+        return jsonify({'error': 'not found'}), 404
+    fmt = request.args.get('format', 'jsonl')
+    if fmt not in exporter.CHUNKERS:
+        raise BadRequest('format must be one of %s' % ', '.join(
+            sorted(exporter.CHUNKERS)))
+    try:
+        since = exporter.parse_since(request.args.get('since'))
+    except ValueError:
+        raise BadRequest('since must be an ISO 8601 timestamp')
+    chunker, mimetype = exporter.CHUNKERS[fmt]
+    rows = exporter.export_rows(entity, since)
+    return Response(stream_with_context(chunker(entity, rows)),
+                    mimetype=mimetype)
+
+#----------------------------------------------------------------------------#
+# Compression.
+#----------------------------------------------------------------------------#
+
+
+@api_v1.after_request
+def compress(response):
+    # streamed responses are left alone so they are never buffered
+    if response.is_streamed or response.direct_passthrough or \
+            response.status_code < 200 or \
+            response.status_code >= 300 or \
+            'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
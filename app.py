@@ -2,60 +2,48 @@
 # Imports
 #----------------------------------------------------------------------------#
 
-import json
-import dateutil.parser
-import babel
+import os
 from flask import (
+    Blueprint,
     Flask,
+    current_app,
     render_template,
     request,
-    Response,
     flash,
     redirect,
-    url_for)
-from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+    url_for,
+    jsonify)
 from sqlalchemy.exc import SQLAlchemyError
 import logging
 from logging import Formatter, FileHandler
-from flask_wtf import Form
-from forms import *
-from flask_migrate import Migrate
-from models import Show, Venue, Artist
-#----------------------------------------------------------------------------#
-# App Config.
-#----------------------------------------------------------------------------#
-
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
-
-# DONE: connect to a local postgresql database
-
-#----------------------------------------------------------------------------#
-# Filters.
-#----------------------------------------------------------------------------#
-
-
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
-
-
-app.jinja_env.filters['datetime'] = format_datetime
+from models import db, Show, Venue, Artist
+import queries
+import search
+import suggest
+from cache import cache
+import page_cache
+from page_cache import cached_page
+from api import api_v1
+import matviews
+import fanout
+import instrumentation
+import metrics
+import pooling
+import filters
+import routing
+import warmup
+import assets
+import images
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
+main = Blueprint('main', __name__)
+
 
-@app.route('/')
+@main.route('/')
+@cached_page
 def index():
     return render_template('pages/home.html')
 
@@ -63,127 +51,52 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@main.route('/venues')
+@cached_page
 def venues():
     # DONE: replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.
-    # start_time = request.form['start_time']
-    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    venue_data = []
-    venues = Venue.query.group_by(
-        Venue.id, Venue.city, Venue.state).all()  # (Venue.id, Venue.city, Venue.state)
-    # add a call to join the show database and retrive the show count and the data
-    listed = []
-    for venue in venues:
-        print(venue.id, venue.city, venue.state)
-        if venue.city in listed:
-            continue
-        listed.append(venue.city)
-        venues_dict = {}
-        venues_dict["city"] = venue.city
-        venues_dict["state"] = venue.state
-        ven = db.session.query(Venue.id, Venue.name).filter_by(city=venue.city)
-        ven_list = []
-        for vid, vname in ven:
-            upcoming_shows = Show.query.filter(
-                Show.venue_id == vid).filter(Show.start_time > now).all()
-            temp = {}
-            temp["id"] = vid
-            temp["name"] = vname
-            temp["num_upcoming_shows"] = len(
-                upcoming_shows)  # update the value here
-            ven_list.append(temp)
-        venues_dict["venues"] = ven_list
-        print(venues_dict)
-        venue_data.append(venues_dict)
-    print(venue_data)
-    return render_template('pages/venues.html', areas=venue_data)
-
-
-@app.route('/venues/search', methods=['POST'])
+    return render_template('pages/venues.html', areas=queries.venue_areas(
+        from_view=current_app.config['MATERIALIZED_VIEWS_ENABLED']))
+
+
+@main.route('/venues/search', methods=['POST'])
 def search_venues():
     # DONE: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
     term = request.form.get('search_term', '')
-    print('%'+term+'%')
-    results = db.session.query(Venue.id, Venue.name).filter(
-        Venue.name.ilike('%'+term+'%'))
-    print(results.all())
-    search_data = {}
-    data = []
-    for vid, vname in results:
-        temp = {}
-        temp['id'] = vid
-        temp['name'] = vname
-        temp['num_upcoming_shows'] = 0
-        data.append(temp)
-    search_data['count'] = len(results.all())
-    search_data['data'] = data
+    search_data = search.search_venues(term)
     return render_template('pages/search_venues.html', results=search_data, search_term=term)
 
 
-@app.route('/venues/<int:venue_id>')
+@main.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
     # DONE: replace with real venue data from the venues table, using venue_id
-    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    v_query = Venue.query.get(venue_id)
-    venue_details = v_query.get_json()
-    upcoming_shows = Show.query.filter(
-        Show.venue_id == venue_id).filter(Show.start_time > now).all()
-    past_shows = Show.query.filter(
-        Show.venue_id == venue_id).filter(Show.start_time <= now).all()
-    upcoming = []
-    for show in upcoming_shows:
-        print(show.id, show.artist_id)
-        temp = {}
-        a_info = Artist.query.filter(
-            Artist.id == show.artist_id).first()
-        temp['artist_id'] = show.artist_id
-        temp['artist_name'] = a_info.name
-        temp['artist_image_link'] = a_info.image_link
-        temp['start_time'] = show.start_time
-        upcoming.append(temp)
-
-    past = []
-    for show in past_shows:
-        print(show.id, show.artist_id)
-        temp = {}
-        a_info = Artist.query.filter(
-            Artist.id == show.artist_id).first()
-        temp['artist_id'] = show.artist_id
-        temp['artist_name'] = a_info.name
-        temp['artist_image_link'] = a_info.image_link
-        temp['start_time'] = show.start_time
-        past.append(temp)
-
-    venue_details['upcoming_shows'] = upcoming
-    venue_details['past_shows'] = past
-    venue_details["past_shows_count"] = len(past_shows)
-    venue_details["upcoming_shows_count"] = len(upcoming_shows)
-
-    print(venue_details)
+    venue_details = queries.cached_venue_details(
+        venue_id, parallel=current_app.config['DETAIL_FANOUT_ENABLED'])
+    if venue_details is None:
+        return render_template('errors/404.html'), 404
     return render_template('pages/show_venue.html', venue=venue_details)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
 
-@app.route('/venues/create', methods=['GET'])
+@main.route('/venues/create', methods=['GET'])
 def create_venue_form():
+    from forms import VenueForm
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@main.route('/venues/create', methods=['POST'])
 def create_venue_submission():
-    print('Received venue', request.form)
     seeking_talent = False
     seeking_description = ""
     try:
         if 'seeking_talent' in request.form:
-            print("Seeking_talent", request.form['seeking_talent'])
             seeking_talent = request.form['seeking_talent'] == 'on'
         if 'seeking_description' in request.form:
             seeking_description = request.form['seeking_description']
@@ -201,6 +114,9 @@ def create_venue_submission():
                       )
         db.session.add(venue)
         db.session.commit()
+        suggest.index.add('venue', venue.id, venue.name)
+        page_cache.bump()
+        matviews.written()
         flash('Venue ' + venue.name + ' was successfully listed!')
     except SQLAlchemyError as e:
         flash('Venue could not be listed!')
@@ -214,26 +130,32 @@ def create_venue_submission():
     return render_template('pages/home.html')
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@main.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
 
     # DONE: Complete this endpoint for taking a venue_id, and using
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
+    success = False
     try:
-        venue = Venue.query.filter(id == venue_id)
-        venue.delete()
+        Venue.query.filter(Venue.id == venue_id).delete()
         db.session.commit()
+        queries.invalidate_venue(int(venue_id))
+        suggest.index.remove('venue', int(venue_id))
+        page_cache.bump()
+        matviews.written()
+        success = True
     except:
         db.session.rollback()
     finally:
         db.session.close()
     # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
     # clicking that button delete it from the db then redirect the user to the homepage
-    return None
+    return jsonify({'success': success})
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@main.route('/artists')
+@cached_page
 def artists():
     # DONE: replace with real data returned from querying the database
     data = [{
@@ -249,76 +171,31 @@ def artists():
     return render_template('pages/artists.html', artists=Artist.query.all())
 
 
-@app.route('/artists/search', methods=['POST'])
+@main.route('/artists/search', methods=['POST'])
 def search_artists():
     term = request.form.get('search_term', '')
-    print('%'+term+'%')
-    results = db.session.query(Artist.id, Artist.name).filter(
-        Artist.name.ilike('%'+term+'%'))
-    print(results.all())
-    search_data = {}
-    data = []
-    for aid, aname in results:
-        temp = {}
-        temp['id'] = aid
-        temp['name'] = aname
-        temp['num_upcoming_shows'] = 0
-        data.append(temp)
-    search_data['count'] = len(results.all())
-    search_data['data'] = data
+    search_data = search.search_artists(term)
     # DONE: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
     return render_template('pages/search_artists.html', results=search_data, search_term=term)
 
 
-@app.route('/artists/<int:artist_id>')
+@main.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-    # shows the venue page with the given venue_id
-    # DONE: replace with real venue data from the venues table, using venue_id
-    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    a_query = Artist.query.get(artist_id)
-    artist_details = a_query.info()
-    upcoming_shows = Show.query.filter(
-        Show.artist_id == artist_id).filter(Show.start_time > now).all()
-    past_shows = Show.query.filter(
-        Show.artist_id == artist_id).filter(Show.start_time <= now).all()
-    upcoming = []
-    for show in upcoming_shows:
-        print(show.id, show.venue_id)
-        temp = {}
-        v_info = Venue.query.filter(
-            Venue.id == show.venue_id).first()
-        temp['venue_id'] = show.venue_id
-        temp['venue_name'] = v_info.name
-        temp['venue_image_link'] = v_info.image_link
-        temp['start_time'] = show.start_time
-        upcoming.append(temp)
-
-    past = []
-    for show in past_shows:
-        print(show.id, show.venue_id)
-        temp = {}
-        v_info = Venue.query.filter(
-            Venue.id == show.venue_id).first()
-        temp['venue_id'] = show.venue_id
-        temp['venue_name'] = v_info.name
-        temp['venue_image_link'] = v_info.image_link
-        temp['start_time'] = show.start_time
-        past.append(temp)
-
-    artist_details['upcoming_shows'] = upcoming
-    artist_details['past_shows'] = past
-    artist_details["past_shows_count"] = len(past_shows)
-    artist_details["upcoming_shows_count"] = len(upcoming_shows)
-
-    print(artist_details)
+    # shows the artist page with the given artist_id
+    # DONE: replace with real artist data from the artists table, using artist_id
+    artist_details = queries.cached_artist_details(
+        artist_id, parallel=current_app.config['DETAIL_FANOUT_ENABLED'])
+    if artist_details is None:
+        return render_template('errors/404.html'), 404
     return render_template('pages/show_artist.html', artist=artist_details)
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@main.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
+    from forms import ArtistForm
     form = ArtistForm()
     artist_data = Artist.query.get(artist_id)
     if artist_data:
@@ -338,14 +215,12 @@ def edit_artist(artist_id):
     # DONE: populate form with fields from artist with ID <artist_id>
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@main.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
     artist_data = Artist.query.get(artist_id)
-    print(request.form)
     seeking_venue = False
     if artist_data:
         if 'seeking_venue' in request.form:
-            print("Seeking_venue", request.form['seeking_venue'])
             seeking_venue = request.form['seeking_venue'] == 'y'
 
         setattr(artist_data, 'name', request.form['name'])
@@ -361,15 +236,20 @@ def edit_artist_submission(artist_id):
                 request.form['seeking_description'])
         setattr(artist_data, 'seeking_venue', seeking_venue)
         db.session.commit()
-        return redirect(url_for('show_artist', artist_id=artist_id))
+        suggest.index.add('artist', artist_id, artist_data.name)
+        queries.invalidate_artist(artist_id)
+        page_cache.bump()
+        matviews.written()
+        return redirect(url_for('.show_artist', artist_id=artist_id))
     return render_template('errors/404.html'), 404
 
     # DONE: take values from the form submitted, and update existing
     # artist record with ID <artist_id> using the new attributes
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
+    from forms import VenueForm
     form = VenueForm()
     venue_data = Venue.query.get(venue_id)
     if venue_data:
@@ -390,13 +270,12 @@ def edit_venue(venue_id):
     # DONE: populate form with values from venue with ID <venue_id>
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@main.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
     venue_data = Venue.query.get(venue_id)
     seeking_talent = False
     if venue_data:
         if 'seeking_talent' in request.form:
-            print("Seeking_talent", request.form['seeking_talent'])
             seeking_talent = request.form['seeking_talent'] == 'y'
 
         setattr(venue_data, 'name', request.form['name'])
@@ -413,7 +292,11 @@ def edit_venue_submission(venue_id):
                 request.form['seeking_description'])
         setattr(venue_data, 'seeking_talent', seeking_talent)
         db.session.commit()
-        return redirect(url_for('show_venue', venue_id=venue_id))
+        suggest.index.add('venue', venue_id, venue_data.name)
+        queries.invalidate_venue(venue_id)
+        page_cache.bump()
+        matviews.written()
+        return redirect(url_for('.show_venue', venue_id=venue_id))
     return render_template('errors/404.html'), 404
     # DONE: take values from the form submitted, and update existing
     # venue record with ID <venue_id> using the new attributes
@@ -422,19 +305,18 @@ def edit_venue_submission(venue_id):
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/create', methods=['GET'])
+@main.route('/artists/create', methods=['GET'])
 def create_artist_form():
+    from forms import ArtistForm
     form = ArtistForm()
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     # called upon submitting the new artist listing form
-    print('Received artist', request.form)
     seeking_venue = False
     if 'seeking_venue' in request.form:
-        print("Seeking_venue", request.form['seeking_venue'])
         seeking_venue = request.form['seeking_venue'] == 'y'
     try:
         artist = Artist(name=request.form['name'],
@@ -449,6 +331,9 @@ def create_artist_submission():
                         seeking_description=request.form['seeking_description']
                         )
         Artist.insert(artist)
+        suggest.index.add('artist', artist.id, artist.name)
+        page_cache.bump()
+        matviews.written()
         flash('Artist ' + artist.name + ' was successfully listed!')
     except SQLAlchemyError as e:
         flash('Artist could not be listed!')
@@ -465,53 +350,46 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@main.route('/shows')
+@cached_page
 def shows():
     # displays list of shows at /shows
     # DONE: replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.
+    after = queries.decode_cursor(request.args.get('after', ''))
+    before = queries.decode_cursor(request.args.get('before', ''))
+    limit = request.args.get('limit', queries.DEFAULT_PAGE_SIZE, type=int)
+    page = queries.shows_page(
+        after=after, before=before, limit=limit,
+        from_view=current_app.config['MATERIALIZED_VIEWS_ENABLED'])
+    return render_template('pages/shows.html', shows=page['shows'], page=page)
 
-    shows_data = []
-    venue_artist = db.session.query(
-        Show.venue_id, Show.artist_id, Show.start_time)
-    print(venue_artist)
-    for venue, artist, start in venue_artist:
-        temp = {}
-        print(venue, artist)
-        venue_details = db.session.query(Venue.name).filter_by(id=venue).all()
-        artist_details = db.session.query(
-            Artist.name, Artist.image_link).filter_by(id=artist).all()
-        (name, image) = artist_details[0]
-        (venue_name,) = venue_details[0]
-        print(venue_name, name, image)
-        temp['venue_id'] = venue
-        temp['venue_name'] = venue_name
-        temp['artist_id'] = artist
-        temp['artist_name'] = name
-        temp['artist_image_link'] = image
-        temp['start_time'] = start
-        shows_data.append(temp)
-
-    return render_template('pages/shows.html', shows=shows_data)
-
-
-@app.route('/shows/create')
+
+@main.route('/shows/create')
 def create_shows():
     # renders form. do not touch.
+    from forms import ShowForm
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@main.route('/shows/create', methods=['POST'])
 def create_show_submission():
-    print('Received show entry', request.form)
+    from forms import ShowForm
+    form = ShowForm()
+    if not form.start_time.validate(form):
+        flash('An error occurred. Show could not be listed!')
+        return render_template('pages/home.html')
     try:
         show = Show(artist_id=request.form['artist_id'],
                     venue_id=request.form['venue_id'],
-                    start_time=request.form['start_time']
+                    start_time=form.start_time.data
                     )
         db.session.add(show)
         db.session.commit()
+        queries.invalidate_show(show.venue_id, show.artist_id)
+        page_cache.bump()
+        matviews.written()
         flash('Show was successfully listed!')
     except SQLAlchemyError as e:
         flash('An error occurred. Show could not be listed!')
@@ -524,26 +402,114 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
-@app.errorhandler(404)
+#  Suggestions
+#  ----------------------------------------------------------------
+
+@main.route('/api/suggest')
+def suggestions():
+    term = request.args.get('q', '')
+    limit = request.args.get('limit', suggest.DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, suggest.MAX_LIMIT))
+    results = suggest.index.suggest(term, limit)
+    for result in results:
+        endpoint = '.show_venue' if result['type'] == 'venue' else '.show_artist'
+        result['url'] = url_for(endpoint, **{result['type'] + '_id': result['id']})
+    return jsonify({'suggestions': results})
+
+
+@main.route('/api/cache/stats')
+def cache_stats():
+    stats = cache.stats()
+    page_stats = page_cache.current_stats()
+    stats['pages'] = {
+        'hits': page_stats.hits,
+        'misses': page_stats.misses,
+        'not_modified': page_stats.not_modified,
+    }
+    return jsonify(stats)
+
+
+@main.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+#----------------------------------------------------------------------------#
+# App Factory.
+#----------------------------------------------------------------------------#
+
+
+def register_commands(app):
+    # Flask-Migrate (and with it alembic) and the maintenance commands are
+    # only needed by the flask command, so serving processes skip them.
+    from flask_migrate import Migrate
+    from importer import import_command
+    from exporter import export_command
+    from counters import counters_command
+    from matviews import matviews_command
+    Migrate(app, db)
+    app.cli.add_command(assets.assets_command)
+    app.cli.add_command(import_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(counters_command)
+    app.cli.add_command(matviews_command)
+
+
+def create_app(config='config'):
+    app = Flask(__name__)
+    app.config.from_object(config)
+    # models.py holds the one db, so Model.query and db.session are the same
+    # session and reads can be routed to replicas
+    db.init_app(app)
+    # DONE: connect to a local postgresql database
+    cache.init_app(app)
+    app.register_blueprint(main)
+    app.register_blueprint(api_v1)
+    # set by the flask command before it loads the app
+    if os.environ.get('FLASK_RUN_FROM_CLI'):
+        register_commands(app)
+    matviews.init_app(app, db)
+    fanout.configure(app.config['FANOUT_MAX_WORKERS'],
+                     app.config['FANOUT_PER_REQUEST'])
+    instrumentation.init_app(app, db)
+    replicas = routing.init_app(app, db)
+    if replicas is not None and app.config['SQL_PROFILING_ENABLED']:
+        for replica in replicas.replicas:
+            instrumentation.watch_engine(replica.engine)
+    page_cache.init_app(app)
+    metrics.init_app(app, db, cache, app.extensions['page_cache'])
+    # the datetime filter; see filters.py
+    filters.init_app(app)
+    # asset_url() and friends, and the fingerprinted files they point at
+    assets.init_app(app)
+    # thumbnail_url() and the /images proxy behind it
+    images.init_app(app)
+
+    if not app.debug:
+        file_handler = FileHandler('error.log')
+        file_handler.setFormatter(
+            Formatter(
+                '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+        )
+        app.logger.setLevel(logging.INFO)
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
+        app.logger.info('errors')
+
+    # after the handlers above so the pool report reaches the log
+    pooling.init_app(app, db)
+    # last, so every template filter and global is registered before templates
+    # are compiled
+    warmup.init_app(app, db)
+    return app
+
+
+app = create_app()
 
 #----------------------------------------------------------------------------#
 # Launch.
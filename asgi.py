@@ -0,0 +1,335 @@
+import asyncio
+import re
+import time
+from urllib.parse import parse_qs
+from asgiref.wsgi import WsgiToAsgi
+from flask import render_template
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app import app
+from cache import cache
+from models import Venue, Artist
+import queries
+import search
+
+#----------------------------------------------------------------------------#
+# Async database.
+#----------------------------------------------------------------------------#
+
+# The read views below run their queries through asyncpg, so one worker keeps
+# many requests waiting on the database at once. Everything else, including
+# every write, is the unchanged Flask app behind WsgiToAsgi (a thread pool).
+#
+# These views bypass Flask's request hooks: their pages are not kept in the
+# page cache and get no ETag or 304, and they send no Server-Timing header
+# and are missing from the SQL profile. Detail payloads are still cached, and
+# the request metrics are recorded. Writes all go through Flask, so they
+# still bump the page version and queue materialized view refreshes.
+
+
+def async_url(url):
+    return make_url(url).set(drivername='postgresql+asyncpg')
+
+
+def async_engine_options(config):
+    # the psycopg2 connect_args do not apply to asyncpg; the same settings
+    # are passed as server_settings instead
+    server_settings = {'application_name': 'fyyur'}
+    if config['DB_STATEMENT_TIMEOUT_MS'] and not config['PGBOUNCER']:
+        server_settings['statement_timeout'] = str(
+            config['DB_STATEMENT_TIMEOUT_MS'])
+    connect_args = {'timeout': config['DB_CONNECT_TIMEOUT'],
+                    'server_settings': server_settings}
+    if config['PGBOUNCER']:
+        # transaction pooling cannot keep prepared statements between
+        # transactions, so asyncpg must not cache them
+        connect_args['statement_cache_size'] = 0
+        return {'connect_args': connect_args,
+                'poolclass': config['SQLALCHEMY_ENGINE_OPTIONS']['poolclass']}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'connect_args': connect_args,
+    }
+
+
+class AsyncDatabase(object):
+    def __init__(self, app):
+        options = async_engine_options(app.config)
+        self.primary = create_async_engine(
+            async_url(app.config['SQLALCHEMY_DATABASE_URI']), **options)
+        self.replicas = app.extensions.get('fyyur_replicas')
+        self.replica_engines = {}
+        if self.replicas is not None:
+            for replica in self.replicas.replicas:
+                self.replica_engines[replica.url] = create_async_engine(
+                    async_url(replica.url), **options)
+
+    async def engine(self, sticky):
+        # same choice as routing.py; the lag probe is synchronous and runs at
+        # most once per check interval, so it is pushed to a thread
+        if self.replicas is None or sticky:
+            return self.primary
+        replica = await asyncio.to_thread(self.replicas.choose)
+        if replica is None:
+            return self.primary
+        return self.replica_engines[replica.url]
+
+    def session(self, engine):
+        return AsyncSession(engine, expire_on_commit=False)
+
+    async def prime(self, count):
+        # the async counterpart of warmup.prime_pool
+        connections = []
+        try:
+            for _ in range(count):
+                connection = self.primary.connect()
+                await connection.start()
+                connections.append(connection)
+        except Exception as e:
+            app.logger.warning('async pool warm-up stopped after %d '
+                               'connections: %s' % (len(connections), e))
+        finally:
+            for connection in connections:
+                await connection.close()
+
+    async def dispose(self):
+        for engine in [self.primary] + list(self.replica_engines.values()):
+            await engine.dispose()
+
+#----------------------------------------------------------------------------#
+# Requests.
+#----------------------------------------------------------------------------#
+
+
+class Request(object):
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query_string = scope.get('query_string', b'')
+        self.headers = [(k.decode('latin-1'), v.decode('latin-1'))
+                        for k, v in scope.get('headers', [])]
+        self.args = dict((k, v[0]) for k, v in parse_qs(
+            self.query_string.decode('latin-1')).items())
+        self.form = dict((k, v[0]) for k, v in parse_qs(
+            body.decode('utf-8'), keep_blank_values=True).items())
+        self.cookies = {}
+        for name, value in self.headers:
+            if name.lower() == 'cookie':
+                for part in value.split(';'):
+                    key, _, val = part.strip().partition('=')
+                    self.cookies[key] = val
+
+    def sticky(self):
+        try:
+            return float(self.cookies.get(
+                app.config['DB_STICKY_COOKIE'], 0)) > time.time()
+        except ValueError:
+            return False
+
+    def int_arg(self, name, default):
+        try:
+            return int(self.args.get(name, default))
+        except ValueError:
+            return default
+
+
+async def render(request, template, status=200, **context):
+    # Rendering is CPU work, so it runs on the default thread pool instead of
+    # holding up every other request on the event loop.
+    return await asyncio.to_thread(_render, request, template, status,
+                                   context)
+
+
+def _render(request, template, status, context):
+    # the request context gives templates url_for and the session, and
+    # flashed messages consumed by the page are saved back to the cookie as
+    # Flask would
+    with app.test_request_context(
+            request.path, method=request.method, headers=request.headers,
+            query_string=request.query_string) as ctx:
+        body = render_template(template, **context)
+        response = app.response_class(body, status=status)
+        app.session_interface.save_session(app, ctx.session, response)
+    return response
+
+#----------------------------------------------------------------------------#
+# Read views.
+#----------------------------------------------------------------------------#
+
+
+async def venues(session, request):
+    rows = await session.execute(queries.venue_areas_statement(
+        app.config['MATERIALIZED_VIEWS_ENABLED']))
+    return await render(request, 'pages/venues.html',
+                        areas=queries.group_areas(rows))
+
+
+async def _details(session, key, statement, shape):
+    # the cache client is synchronous (a redis round trip), so it is kept off
+    # the event loop too
+    details = await asyncio.to_thread(cache.get, key)
+    if details is None:
+        result = await session.execute(statement)
+        details = shape(result.unique().scalars().first())
+        if details is not None:
+            await asyncio.to_thread(cache.set, key, details)
+    return details
+
+
+async def show_venue(session, request, venue_id):
+    venue = await _details(session, 'venue:%d' % venue_id,
+                           queries.venue_details_statement(venue_id),
+                           queries.venue_details_from)
+    if venue is None:
+        return await render(request, 'errors/404.html', status=404)
+    return await render(request, 'pages/show_venue.html', venue=venue)
+
+
+async def show_artist(session, request, artist_id):
+    artist = await _details(session, 'artist:%d' % artist_id,
+                            queries.artist_details_statement(artist_id),
+                            queries.artist_details_from)
+    if artist is None:
+        return await render(request, 'errors/404.html', status=404)
+    return await render(request, 'pages/show_artist.html', artist=artist)
+
+
+async def shows(session, request):
+    after = queries.decode_cursor(request.args.get('after', ''))
+    before = queries.decode_cursor(request.args.get('before', ''))
+    limit = queries.clamp_page_size(
+        request.int_arg('limit', queries.DEFAULT_PAGE_SIZE))
+    rows = await session.execute(queries.shows_page_statement(
+        after, before, limit, app.config['MATERIALIZED_VIEWS_ENABLED']))
+    page = queries.shows_page_from(rows, after, before, limit)
+    return await render(request, 'pages/shows.html', shows=page['shows'],
+                        page=page)
+
+
+def _search_view(model, template):
+    async def view(session, request):
+        term = request.form.get('search_term', '')
+        rows = await session.execute(search.search_statement(model, term))
+        return await render(request, template,
+                            results=search.search_results(rows),
+                            search_term=term)
+    return view
+
+
+# (method, path pattern, endpoint, view); the endpoint names match app.py so
+# metrics from both modes line up
+ROUTES = [
+    ('GET', r'/venues', 'main.venues', venues),
+    ('GET', r'/venues/(\d+)', 'main.show_venue', show_venue),
+    ('GET', r'/artists/(\d+)', 'main.show_artist', show_artist),
+    ('GET', r'/shows', 'main.shows', shows),
+    ('POST', r'/venues/search', 'main.search_venues',
+     _search_view(Venue, 'pages/search_venues.html')),
+    ('POST', r'/artists/search', 'main.search_artists',
+     _search_view(Artist, 'pages/search_artists.html')),
+]
+ROUTES = [(method, re.compile(pattern + '$'), endpoint, view)
+          for method, pattern, endpoint, view in ROUTES]
+
+
+def match(method, path):
+    for route_method, pattern, endpoint, view in ROUTES:
+        if route_method == method:
+            found = pattern.match(path)
+            if found:
+                return endpoint, view, [int(g) for g in found.groups()]
+    return None
+
+#----------------------------------------------------------------------------#
+# ASGI application.
+#----------------------------------------------------------------------------#
+
+
+async def _read_body(receive):
+    body = b''
+    more = True
+    while more:
+        message = await receive()
+        body += message.get('body', b'')
+        more = message.get('more_body', False)
+    return body
+
+
+async def _send(send, response):
+    headers = [(k.lower().encode('latin-1'), v.encode('latin-1'))
+               for k, v in response.headers.items()]
+    await send({'type': 'http.response.start',
+                'status': response.status_code, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+
+class Application(object):
+    def __init__(self, app):
+        self.app = app
+        self.flask = WsgiToAsgi(app)
+        self.db = None
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.db = AsyncDatabase(self.app)
+                if self.app.config['WARMUP_ENABLED']:
+                    await self.db.prime(self.app.config['WARMUP_CONNECTIONS'])
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.db is not None:
+                    await self.db.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        found = None
+        if scope['type'] == 'http':
+            found = match(scope['method'], scope['path'])
+        if found is None:
+            return await self.flask(scope, receive, send)
+        if self.db is None:
+            # servers that skip the lifespan protocol
+            self.db = AsyncDatabase(self.app)
+
+        endpoint, view, args = found
+        start = time.perf_counter()
+        try:
+            request = Request(scope, await _read_body(receive))
+        except UnicodeDecodeError:
+            # a form body that is not UTF-8
+            response = self.app.response_class('Bad Request', status=400,
+                                               mimetype='text/plain')
+        else:
+            response = await self.dispatch(request, view, args)
+        app_metrics = self.app.extensions['metrics']
+        app_metrics.request_duration.observe(time.perf_counter() - start,
+                                             endpoint)
+        app_metrics.requests_total.inc(endpoint, scope['method'],
+                                       response.status_code)
+        await _send(send, response)
+
+    async def dispatch(self, request, view, args):
+        engine = await self.db.engine(request.sticky())
+        try:
+            async with self.db.session(engine) as session:
+                response = await view(session, request, *args)
+        except Exception:
+            self.app.logger.exception('%s %s failed' % (request.method,
+                                                        request.path))
+            response = await render(request, 'errors/500.html', status=500)
+        if self.db.replicas is not None:
+            response.headers['X-DB-Route'] = \
+                'primary' if engine is self.db.primary else 'replica'
+        return response
+
+
+application = Application(app)
@@ -0,0 +1,295 @@
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import time
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+#----------------------------------------------------------------------------#
+# Bundles.
+#----------------------------------------------------------------------------#
+
+# Output name -> sources under static/, concatenated in this order. The head
+# scripts run before the page renders; the deferred ones after it is parsed.
+BUNDLES = {
+    'main.css': ['css/bootstrap.min.css', 'css/layout.main.css',
+                 'css/main.css', 'css/main.responsive.css',
+                 'css/main.quickfix.css'],
+    'head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+    'deferred.js': ['js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js',
+                    'js/script.js'],
+}
+# Every other file under these directories is copied with a fingerprint.
+COPY_DIRS = ['css', 'js', 'fonts', 'img', 'ico']
+# Widths of the resized renditions of each image, never wider than the
+# source; the JPEGs are for browsers without WebP or AVIF.
+IMAGE_WIDTHS = [480, 960, 1440]
+IMAGE_FORMATS = [('avif', 'AVIF', {'quality': 50}),
+                 ('webp', 'WEBP', {'quality': 75, 'method': 6}),
+                 ('jpg', 'JPEG', {'quality': 80, 'optimize': True,
+                                  'progressive': True})]
+RESPONSIVE_IMAGES = ['img/front-splash.jpg']
+COMPRESSIBLE = ('.css', '.js', '.svg', '.map', '.ttf', '.otf', '.eot',
+                '.json')
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+
+#----------------------------------------------------------------------------#
+# Build.
+#----------------------------------------------------------------------------#
+
+
+def fingerprint(name, data):
+    root, ext = posixpath.splitext(name)
+    return '%s.%s%s' % (root, hashlib.sha256(data).hexdigest()[:HASH_LENGTH],
+                        ext)
+
+
+def write(static_dir, name, data):
+    path = os.path.join(static_dir, *name.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def precompress(path, data):
+    # Sibling .gz and .br files, kept only when they are actually smaller.
+    # mtime=0 keeps the gzip output identical between builds.
+    written = []
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) < len(data):
+        with open(path + '.gz', 'wb') as f:
+            f.write(compressed)
+        written.append('gz')
+    try:
+        import brotli
+    except ImportError:
+        return written
+    compressed = brotli.compress(data, quality=11)
+    if len(compressed) < len(data):
+        with open(path + '.br', 'wb') as f:
+            f.write(compressed)
+        written.append('br')
+    return written
+
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def rewrite_css_urls(css, source, files):
+    # Bundled CSS is served from another directory than its sources, so
+    # relative url()s are resolved against the source file and pointed at
+    # the fingerprinted copy (or the plain static path if there is none).
+    def replace(match):
+        target = match.group(2)
+        if re.match(r'^(data:|https?:|//|/|#)', target):
+            return match.group(0)
+        # keep any ?query or #fragment, e.g. the IE "font.eot?#iefix" hack
+        path, suffix = re.match(r'([^?#]*)(.*)', target).groups()
+        name = posixpath.normpath(posixpath.join(posixpath.dirname(source),
+                                                 path))
+        if name in files:
+            # bundles are written to the top of dist/
+            return 'url(%s%s)' % (posixpath.relpath(files[name], 'dist'),
+                                  suffix)
+        return 'url(/static/%s%s)' % (name, suffix)
+    return CSS_URL.sub(replace, css)
+
+
+def minify(name, text):
+    # rcssmin and rjsmin are build-time only, like the image encoders; /*!
+    # license comments are kept
+    if name.endswith('.css'):
+        import rcssmin
+        return rcssmin.cssmin(text, keep_bang_comments=True)
+    import rjsmin
+    return rjsmin.jsmin(text, keep_bang_comments=True)
+
+
+def bundle(static_dir, name, sources, files):
+    parts = []
+    for source in sources:
+        with open(os.path.join(static_dir, source), encoding='utf-8') as f:
+            text = f.read()
+        if name.endswith('.css'):
+            text = rewrite_css_urls(text, source, files)
+        # a library ending without a semicolon must not run into the next
+        parts.append(minify(name, text).strip().rstrip(';') +
+                     (';' if name.endswith('.js') else ''))
+    return '\n'.join(parts).encode('utf-8')
+
+
+def responsive_images(path):
+    # Yields (format extension, width, encoded bytes) for every rendition
+    # this Pillow build can encode.
+    from PIL import Image, features
+    with Image.open(path) as image:
+        image = image.convert('RGB')
+        widths = sorted(set(min(width, image.width)
+                            for width in IMAGE_WIDTHS))
+        for ext, pil_format, options in IMAGE_FORMATS:
+            if ext != 'jpg' and not features.check(ext):
+                continue
+            for width in widths:
+                height = round(image.height * width / image.width)
+                output = io.BytesIO()
+                image.resize((width, height), Image.LANCZOS).save(
+                    output, pil_format, **options)
+                yield ext, width, output.getvalue()
+
+
+def build(static_dir):
+    # Writes static/dist/ from scratch and returns the manifest: logical
+    # name -> fingerprinted path under static/, plus image renditions.
+    out_dir = os.path.join(static_dir, 'dist')
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    files = {}
+    compressed = 0
+
+    def emit(name, data):
+        nonlocal compressed
+        output = fingerprint('dist/' + name, data)
+        path = write(static_dir, output, data)
+        if name.endswith(COMPRESSIBLE):
+            compressed += len(precompress(path, data))
+        files[name] = output
+
+    # plain files first, so bundles can point their url()s at them
+    for directory in COPY_DIRS:
+        for root, _, filenames in os.walk(os.path.join(static_dir,
+                                                       directory)):
+            for filename in sorted(filenames):
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, static_dir).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    emit(name, f.read())
+    for name, sources in BUNDLES.items():
+        emit(name, bundle(static_dir, name, sources, files))
+
+    images = {}
+    for name in RESPONSIVE_IMAGES:
+        renditions = images[name] = {}
+        root, _ = posixpath.splitext(name)
+        for ext, width, data in responsive_images(os.path.join(static_dir,
+                                                               name)):
+            output = fingerprint('dist/%s-%d.%s' % (root, width, ext), data)
+            write(static_dir, output, data)
+            renditions.setdefault(ext, []).append([width, output])
+    manifest = {'files': files, 'images': images}
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest, compressed
+
+#----------------------------------------------------------------------------#
+# Serving.
+#----------------------------------------------------------------------------#
+
+
+class Assets(object):
+    def __init__(self):
+        self.manifest = {'files': {}, 'images': {}}
+
+    def load(self, static_dir):
+        path = os.path.join(static_dir, 'dist', MANIFEST)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'files': {}, 'images': {}}
+
+    @property
+    def built(self):
+        return bool(self.manifest['files'])
+
+    def url(self, name):
+        # the fingerprinted copy once built, the source file before that
+        hashed = self.manifest['files'].get(name)
+        if hashed is None:
+            return url_for('static', filename=name)
+        return url_for('assets.serve', filename=hashed[len('dist/'):])
+
+    def urls(self, bundle):
+        if bundle in self.manifest['files']:
+            return [self.url(bundle)]
+        return [url_for('static', filename=source)
+                for source in BUNDLES[bundle]]
+
+    def srcset(self, name, ext):
+        return ', '.join('%s %dw' % (url_for('assets.serve',
+                                             filename=path[len('dist/'):]),
+                                     width)
+                         for width, path in
+                         self.manifest['images'].get(name, {}).get(ext, []))
+
+
+def serve(filename):
+    # Fingerprinted files never change, so they may be cached for good.
+    # A precompressed sibling is sent when the client accepts it.
+    directory = os.path.join(current_app.static_folder, 'dist')
+    path = safe_join(directory, filename)
+    if filename == MANIFEST or path is None or not os.path.isfile(path):
+        raise NotFound()
+    accepted = request.accept_encodings
+    variants = [(encoding, suffix)
+                for encoding, suffix in (('br', '.br'), ('gzip', '.gz'))
+                if os.path.isfile(path + suffix)]
+    encoding = next((encoding for encoding, suffix in variants
+                     if accepted[encoding]), None)
+    response = send_from_directory(
+        directory, filename + dict(variants).get(encoding, ''),
+        mimetype=mimetypes.guess_type(filename)[0],
+        max_age=current_app.config['ASSETS_MAX_AGE'])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if variants:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+#----------------------------------------------------------------------------#
+# Flask integration.
+#----------------------------------------------------------------------------#
+
+
+def init_app(app):
+    app.config.setdefault('ASSETS_MAX_AGE', 365 * 24 * 3600)
+    assets = app.extensions['assets'] = Assets()
+    assets.load(app.static_folder)
+    app.add_url_rule('/static/dist/<path:filename>', 'assets.serve', serve)
+    app.jinja_env.globals.update(asset_url=assets.url,
+                                 asset_urls=assets.urls,
+                                 asset_srcset=assets.srcset)
+
+
+@click.group('assets')
+def assets_command():
+    """Build the fingerprinted static assets."""
+
+
+@assets_command.command('build')
+@with_appcontext
+def build_command():
+    """Bundle, minify, fingerprint and precompress static/ into static/dist."""
+    start = time.perf_counter()
+    manifest, compressed = build(current_app.static_folder)
+    click.echo('built %d files, %d compressed variants and %d images into '
+               'static/dist in %.1fs' % (
+                   len(manifest['files']), compressed,
+                   sum(len(renditions) for image in manifest['images']
+                       .values() for renditions in image.values()),
+                   time.perf_counter() - start))
@@ -0,0 +1,98 @@
+# Bytes and requests for a first and a repeat visit to the home page, with
+# the plain static files and with the output of `flask assets build`.
+#
+#   flask assets build
+#   python -m benchmarks.assets [--width 960]
+#
+# A small browser model: it requests every same-origin stylesheet, script
+# and icon the page links, plus the splash image in the first format the
+# page offers (AVIF when built) at the smallest width of at least --width.
+# On the repeat visit, responses marked immutable are reused without a
+# request and everything else is revalidated with If-None-Match or
+# If-Modified-Since. Links that 404 (the favicons are not in static/ico) are
+# left out of both visits.
+import argparse
+import re
+from app import app
+
+ACCEPT_ENCODING = 'br, gzip'
+LINKS = re.compile(r'<(?:link|script)[^>]*?(?:href|src)="(/static/[^"]+)"')
+SOURCE = re.compile(r'<source[^>]*?srcset="([^"]+)"', re.S)
+IMAGE = re.compile(r'<img[^>]*?id="front-splash"[^>]*?src="([^"]+)"', re.S)
+
+
+def pick(srcset, width):
+    candidates = sorted((int(size[:-1]), url) for url, size in
+                        (item.split() for item in srcset.split(',')))
+    for size, url in candidates:
+        if size >= width:
+            return url
+    return candidates[-1][1]
+
+
+def page_assets(html, width):
+    urls = list(dict.fromkeys(LINKS.findall(html)))
+    sources = SOURCE.findall(html)
+    if sources:
+        urls.append(pick(sources[0], width))
+    else:
+        urls.extend(IMAGE.findall(html))
+    return urls
+
+
+def visit(client, urls, cached):
+    requests = transferred = 0
+    for url in urls:
+        previous = cached.get(url)
+        if previous is not None and previous.cache_control.immutable:
+            continue
+        headers = {'Accept-Encoding': ACCEPT_ENCODING}
+        if previous is not None:
+            for validator, condition in (('ETag', 'If-None-Match'),
+                                         ('Last-Modified',
+                                          'If-Modified-Since')):
+                if previous.headers.get(validator):
+                    headers[condition] = previous.headers[validator]
+        response = client.get(url, headers=headers)
+        requests += 1
+        transferred += len(response.get_data())
+        if response.status_code == 200:
+            cached[url] = response
+        response.close()
+    return requests, transferred
+
+
+def found(client, urls):
+    return [url for url in urls if client.head(url).status_code != 404]
+
+
+def run(width):
+    # the home page is otherwise served from the page cache with whichever
+    # asset URLs it was first rendered with
+    app.config['PAGE_CACHE_ENABLED'] = False
+    assets = app.extensions['assets']
+    built = assets.manifest
+    print('%-8s %8s %10s %10s %10s' % ('static', 'assets', 'first KB',
+                                       'repeat req', 'repeat KB'))
+    for name, manifest in (('plain', {'files': {}, 'images': {}}),
+                           ('built', built)):
+        if name == 'built' and not built['files']:
+            print('built    run `flask assets build` first')
+            continue
+        assets.manifest = manifest
+        client = app.test_client()
+        html = client.get('/').get_data(as_text=True)
+        urls = found(client, page_assets(html, width))
+        cached = {}
+        _, first = visit(client, urls, cached)
+        requests, repeat = visit(client, urls, cached)
+        print('%-8s %8d %10.1f %10d %10.1f' % (name, len(urls), first / 1024,
+                                               requests, repeat / 1024))
+    assets.manifest = built
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Home page transfer size.')
+    parser.add_argument('--width', type=int, default=960,
+                        help='image width the browser asks for')
+    run(parser.parse_args().width)
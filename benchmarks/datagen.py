@@ -0,0 +1,169 @@
+# Deterministic synthetic catalog for benchmarks.
+#
+#   python -m benchmarks.datagen --venues 10000 --artists 100000 \
+#       --shows 5000000 --seed 42 --truncate
+#
+# The same seed and sizes always produce the same rows and ids. Rows are
+# generated lazily and streamed into postgres with COPY, so millions of shows
+# load without being held in memory.
+import argparse
+import csv
+import io
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from app import app
+from models import db
+from forms import GENRES, STATES
+import counters
+
+ADJECTIVES = ['Blue', 'Golden', 'Electric', 'Velvet', 'Silver', 'Midnight',
+              'Crimson', 'Rusty', 'Neon', 'Wild', 'Lucky', 'Hidden']
+NOUNS = ['Room', 'Hall', 'Lounge', 'Tavern', 'Garden', 'Cellar', 'Stage',
+         'Club', 'Theatre', 'Barn', 'Loft', 'Dock']
+BANDS = ['Petals', 'Sax Band', 'Quartet', 'Collective', 'Orchestra', 'Trio',
+         'Riot', 'Echoes', 'Brothers', 'Sisters', 'Machines', 'Ghosts']
+CITIES = ['San Francisco', 'New York', 'Austin', 'Seattle', 'Chicago',
+          'Nashville', 'Denver', 'Portland', 'Boston', 'Atlanta']
+GENRE_NAMES = [name for name, _ in GENRES]
+STATE_NAMES = [name for name, _ in STATES]
+# shows spread over five years centred on EPOCH, so about half are upcoming
+EPOCH = datetime(2020, 6, 1, tzinfo=timezone.utc)
+SPREAD = timedelta(days=365 * 5)
+
+
+def _array(values):
+    return '{%s}' % ','.join('"%s"' % v for v in values)
+
+
+def venues(rng, count):
+    for i in range(1, count + 1):
+        yield (i, '%s %s %d' % (rng.choice(ADJECTIVES), rng.choice(NOUNS), i),
+               _array(rng.sample(GENRE_NAMES, rng.randint(1, 3))),
+               rng.choice(CITIES), rng.choice(STATE_NAMES),
+               '%d Main St' % rng.randint(1, 9999),
+               '555-%03d-%04d' % (rng.randint(0, 999), rng.randint(0, 9999)),
+               'https://picsum.photos/seed/venue%d/600/400' % i,
+               rng.random() < 0.5)
+
+
+def artists(rng, count):
+    for i in range(1, count + 1):
+        yield (i, 'The %s %s %d' % (rng.choice(ADJECTIVES),
+                                    rng.choice(BANDS), i),
+               _array(rng.sample(GENRE_NAMES, rng.randint(1, 3))),
+               rng.choice(CITIES), rng.choice(STATE_NAMES),
+               'https://picsum.photos/seed/artist%d/600/400' % i,
+               rng.random() < 0.5)
+
+
+def shows(rng, count, num_venues, num_artists):
+    start = EPOCH - SPREAD / 2
+    seconds = int(SPREAD.total_seconds())
+    for i in range(1, count + 1):
+        start_time = start + timedelta(seconds=rng.randrange(seconds))
+        yield (i, rng.randint(1, num_venues), rng.randint(1, num_artists),
+               start_time.isoformat())
+
+
+TABLES = [
+    ('venues', ['id', 'name', 'genres', 'city', 'state', 'address', 'phone',
+                'image_link', 'seeking_talent']),
+    ('artists', ['id', 'name', 'genres', 'city', 'state', 'image_link',
+                 'seeking_venue']),
+    ('shows', ['id', 'venue_id', 'artist_id', 'start_time']),
+]
+
+
+class _CsvStream(io.RawIOBase):
+    # file-like view over a row generator, encoded as CSV on demand
+    def __init__(self, rows):
+        self._rows = rows
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = io.StringIO()
+            writer = csv.writer(chunk)
+            for row in self._take(1000):
+                writer.writerow(row)
+            data = chunk.getvalue().encode('utf-8')
+            if not data:
+                break
+            self._buffer += data
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _take(self, n):
+        for _ in range(n):
+            row = next(self._rows, None)
+            if row is None:
+                return
+            yield row
+
+
+def copy_rows(cursor, table, columns, rows):
+    cursor.copy_expert('COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (
+        table, ', '.join(columns)), _CsvStream(rows), size=1 << 16)
+    cursor.execute("SELECT setval('%s_id_seq', (SELECT max(id) FROM %s))" % (
+        table, table))
+
+
+def generate(num_venues, num_artists, num_shows, seed=42, truncate=False):
+    # each table gets its own generator so sizes can change independently
+    # without reshuffling the other tables
+    sources = {
+        'venues': venues(random.Random('%s:venues' % seed), num_venues),
+        'artists': artists(random.Random('%s:artists' % seed), num_artists),
+        'shows': shows(random.Random('%s:shows' % seed), num_shows,
+                       num_venues, num_artists),
+    }
+    with app.app_context():
+        connection = db.get_engine().raw_connection()
+        try:
+            cursor = connection.cursor()
+            if truncate:
+                cursor.execute('TRUNCATE shows, artists, venues '
+                               'RESTART IDENTITY CASCADE')
+            # the per-row counter trigger would double the cost of loading
+            # shows; the counters are recomputed in one pass afterwards
+            cursor.execute('ALTER TABLE shows DISABLE TRIGGER '
+                           'show_counters_update')
+            for table, columns in TABLES:
+                start = time.perf_counter()
+                copy_rows(cursor, table, columns, sources[table])
+                print('%-8s loaded in %.1fs' % (
+                    table, time.perf_counter() - start))
+            cursor.execute('ALTER TABLE shows ENABLE TRIGGER '
+                           'show_counters_update')
+            cursor.execute('UPDATE show_counter_watermark SET rolled_at = now()')
+            for table, fk in counters.TABLES:
+                cursor.execute(counters.FIX_SQL.format(
+                    table=table,
+                    expected=counters.EXPECTED_SQL.format(table=table, fk=fk)))
+            cursor.execute('ANALYZE')
+            connection.commit()
+        finally:
+            connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load a deterministic synthetic catalog.')
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=10000)
+    parser.add_argument('--shows', type=int, default=100000)
+    parser.add_argument('--seed', default='42')
+    parser.add_argument('--truncate', action='store_true',
+                        help='empty the catalog first')
+    args = parser.parse_args()
+    generate(args.venues, args.artists, args.shows, args.seed, args.truncate)
+
+
+if __name__ == '__main__':
+    main()
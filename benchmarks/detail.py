@@ -0,0 +1,70 @@
+# Checks that the venue and artist detail pages cost a constant number of
+# queries regardless of how many shows they list.
+#
+#   python -m benchmarks.detail [sizes...]
+#
+# Exits non-zero if a page issues more than one query. Rows are flushed inside
+# a transaction that is rolled back at the end.
+import sys
+from datetime import datetime, timezone
+from app import app
+from models import db, Venue, Artist, Show
+import queries
+from benchmarks import count_queries, timed
+
+MAX_QUERIES = 1
+
+
+def seed(num_shows):
+    venue = Venue(name='Benchmark Venue', genres=['Jazz'], city='Austin',
+                  state='TX', address='1 Main St')
+    artist = Artist(name='Benchmark Artist', genres=['Jazz'], city='Austin',
+                    state='TX', phone=None, image_link=None, website=None,
+                    facebook_link=None)
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    shows = []
+    for i in range(num_shows):
+        start_time = datetime(2010 + i % 40, 1, 1, 20, tzinfo=timezone.utc)
+        shows.append(Show(venue_id=venue.id, artist_id=artist.id,
+                          start_time=start_time))
+    db.session.add_all(shows)
+    db.session.flush()
+    # start from an empty identity map, as a fresh request would
+    db.session.expunge_all()
+    return venue.id, artist.id
+
+
+def measure(engine, load, entity_id):
+    with count_queries(engine) as counter, timed() as timing:
+        load(entity_id)
+    db.session.expunge_all()
+    return counter.count, timing['elapsed']
+
+
+def run(sizes):
+    failed = False
+    print('%10s %10s %12s %10s %12s' % (
+        'shows', 'venue q', 'venue s', 'artist q', 'artist s'))
+    with app.app_context():
+        engine = db.get_engine()
+        try:
+            for size in sizes:
+                venue_id, artist_id = seed(size)
+                venue_count, venue_elapsed = measure(
+                    engine, queries.venue_details, venue_id)
+                artist_count, artist_elapsed = measure(
+                    engine, queries.artist_details, artist_id)
+                print('%10d %10d %12.4f %10d %12.4f' % (
+                    size, venue_count, venue_elapsed, artist_count,
+                    artist_elapsed))
+                if max(venue_count, artist_count) > MAX_QUERIES:
+                    failed = True
+        finally:
+            db.session.rollback()
+    return not failed
+
+
+if __name__ == '__main__':
+    ok = run([int(arg) for arg in sys.argv[1:]] or [0, 10, 100, 500])
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,73 @@
+# Compares the single joined detail query with the parallel fan-out of
+# entity, upcoming shows and past shows (queries.venue_details_parallel).
+#
+#   python -m benchmarks.fanout [sizes...]
+#
+# The parallel path reads on separate connections, which cannot see an
+# uncommitted transaction, so the benchmark rows are committed and deleted
+# again at the end.
+import sys
+from datetime import timedelta
+from app import app
+from models import db, Venue, Artist, Show
+import queries
+from benchmarks import timed
+
+ROUNDS = 20
+
+
+def seed(num_shows):
+    venue = Venue(name='Fanout Venue', genres=['Jazz'], city='Austin',
+                  state='TX', address='1 Main St')
+    artist = Artist(name='Fanout Artist', genres=['Jazz'], city='Austin',
+                    state='TX', phone=None, image_link=None, website=None,
+                    facebook_link=None)
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    # half past, half upcoming
+    start = queries.current_time() - timedelta(days=num_shows // 2)
+    db.session.add_all([Show(venue_id=venue.id, artist_id=artist.id,
+                             start_time=start + timedelta(days=i))
+                        for i in range(num_shows)])
+    db.session.commit()
+    return venue.id, artist.id
+
+
+def cleanup(venue_id, artist_id):
+    Show.query.filter(Show.venue_id == venue_id).delete()
+    Venue.query.filter(Venue.id == venue_id).delete()
+    Artist.query.filter(Artist.id == artist_id).delete()
+    db.session.commit()
+
+
+def best_of(load, entity_id):
+    best = None
+    for _ in range(ROUNDS):
+        db.session.expunge_all()
+        with timed() as timing:
+            load(entity_id)
+        if best is None or timing['elapsed'] < best:
+            best = timing['elapsed']
+    return best
+
+
+def run(sizes):
+    print('%10s %12s %12s %8s' % ('shows', 'joined ms', 'parallel ms',
+                                  'speedup'))
+    with app.app_context():
+        engine = db.get_engine()
+        for size in sizes:
+            venue_id, artist_id = seed(size)
+            try:
+                joined = best_of(queries.venue_details, venue_id)
+                parallel = best_of(lambda venue_id: queries.
+                                   venue_details_parallel(venue_id, engine),
+                                   venue_id)
+            finally:
+                cleanup(venue_id, artist_id)
+            print('%10d %12.2f %12.2f %7.2fx' % (
+                size, joined * 1000, parallel * 1000, joined / parallel))
+
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 10000])
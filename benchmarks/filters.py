@@ -0,0 +1,71 @@
+# Micro-benchmark of the datetime filter against the implementation it
+# replaced (dateutil parse plus babel pattern parsing on every call).
+#
+#   python -m benchmarks.filters [calls]
+#
+# Renders the same mix a busy /shows page does: many tiles over a smaller
+# set of distinct start times, given both as datetimes and as strings.
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+import babel.dates
+import dateutil.parser
+from app import app
+import filters
+from benchmarks import timed
+
+
+def legacy_format_datetime(value, format='medium'):
+    if isinstance(value, datetime):
+        date = value
+    else:
+        date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en_US')
+
+
+def sample(calls, distinct=500, seed=42):
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    times = [start + timedelta(hours=rng.randrange(24 * 365))
+             for _ in range(distinct)]
+    values = []
+    for _ in range(calls):
+        value = rng.choice(times)
+        values.append(value.isoformat() if rng.random() < 0.5 else value)
+    return values
+
+
+def run(calls):
+    # rendered through a template so the filter sees the context it gets
+    # on a real page
+    values = sample(calls)
+    source = "{% for v in values %}{{ v|FILTER('full') }}{% endfor %}"
+    with app.test_request_context('/'):
+        env = app.jinja_env.overlay()
+        env.filters['legacy'] = legacy_format_datetime
+        legacy_template = env.from_string(source.replace('FILTER', 'legacy'))
+        new_template = env.from_string(source.replace('FILTER', 'datetime'))
+        context = {'values': values}
+        app.update_template_context(context)
+        assert legacy_template.render(context) == \
+            new_template.render(context)
+        filters._format.cache_clear()
+        with timed() as legacy:
+            legacy_template.render(context)
+        with timed() as cold:
+            new_template.render(context)
+        with timed() as warm:
+            new_template.render(context)
+    print('%-22s %10s %12s' % ('filter', 'ms', 'us/call'))
+    for name, timing in (('legacy', legacy), ('new, cold cache', cold),
+                         ('new, warm cache', warm)):
+        print('%-22s %10.1f %12.2f' % (name, timing['elapsed'] * 1000,
+                                       timing['elapsed'] / calls * 1e6))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,86 @@
+# Serves a tile image straight from its origin versus through the /images
+# thumbnail proxy, against a local HTTP stand-in for the external host.
+#
+#   python -m benchmarks.images [--tiles 30]
+#
+# Writes --tiles distinct full-size JPEGs to a temporary directory, serves
+# them with http.server on a local port and requests each tile the way the
+# /shows grid does: bytes and time for the originals, then for the proxy on
+# a cold disk cache (fetch and resize) and a warm one.
+import argparse
+import functools
+import http.server
+import random
+import tempfile
+import threading
+import urllib.request
+from app import app
+from images import thumbnail_url
+from benchmarks import timed
+
+
+def write_images(directory, count, size=(2400, 1600)):
+    from PIL import Image
+    rng = random.Random(7)
+    for i in range(count):
+        # noise compresses badly, so the originals are photo-sized
+        image = Image.effect_noise(size, 60).convert('RGB')
+        image = Image.merge('RGB', [band.point(
+            lambda v, shift=rng.randrange(80): min(255, v + shift))
+            for band in image.split()])
+        image.save('%s/%d.jpg' % (directory, i), 'JPEG', quality=90)
+
+
+def serve(directory):
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def run(tiles):
+    with tempfile.TemporaryDirectory() as origin, \
+            tempfile.TemporaryDirectory() as cache_dir:
+        write_images(origin, tiles)
+        server = serve(origin)
+        base = 'http://127.0.0.1:%d' % server.server_address[1]
+        app.config['IMAGE_PROXY_ALLOW_PRIVATE'] = True
+        app.extensions['images'].directory = cache_dir
+        links = ['%s/%d.jpg' % (base, i) for i in range(tiles)]
+        client = app.test_client()
+        headers = {'Accept': 'image/avif,image/webp,*/*'}
+        with app.test_request_context('/'):
+            proxied = [thumbnail_url(link, 360) for link in links]
+
+        results = []
+        with timed() as direct:
+            size = sum(len(urllib.request.urlopen(link).read())
+                       for link in links)
+        results.append(('origin', size, direct))
+        for name in ('proxy, cold', 'proxy, warm'):
+            with timed() as timing:
+                size = 0
+                for url in proxied:
+                    response = client.get(url, headers=headers)
+                    assert response.status_code == 200, response.status
+                    size += len(response.get_data())
+            results.append((name, size, timing))
+        server.shutdown()
+
+    print('%-14s %12s %12s %10s' % ('tiles', 'total KB', 'KB/tile',
+                                    'ms/tile'))
+    for name, size, timing in results:
+        print('%-14s %12.1f %12.1f %10.2f' % (
+            name, size / 1024, size / 1024 / tiles,
+            timing['elapsed'] * 1000 / tiles))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Image proxy benchmark.')
+    parser.add_argument('--tiles', type=int, default=30)
+    run(parser.parse_args().tiles)
@@ -0,0 +1,103 @@
+# Minimal asyncio HTTP/1.1 load generator, so the suite needs nothing beyond
+# the standard library. Each client keeps one keep-alive connection and
+# replays the request list until the duration runs out.
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+
+class Result(object):
+    def __init__(self):
+        self.latencies = {}   # path -> [seconds]
+        self.errors = 0
+        self.elapsed = 0.0
+
+    @property
+    def count(self):
+        return sum(len(v) for v in self.latencies.values())
+
+
+async def _read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    length = None
+    chunked = False
+    close = False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        value = value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value:
+            chunked = True
+        elif name == 'connection' and value == 'close':
+            close = True
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()
+        close = True
+    return status, close
+
+
+async def _client(host, port, requests, deadline, result, offset):
+    reader = writer = None
+    i = offset
+    while time.perf_counter() < deadline:
+        method, path, body = requests[i % len(requests)]
+        i += 1
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            head = '%s %s HTTP/1.1\r\nHost: %s\r\nContent-Length: %d\r\n' % (
+                method, path, host, len(body))
+            if body:
+                head += 'Content-Type: application/x-www-form-urlencoded\r\n'
+            start = time.perf_counter()
+            writer.write(head.encode('latin-1') + b'\r\n' + body)
+            status, close = await _read_response(reader)
+            elapsed = time.perf_counter() - start
+            if status >= 500:
+                result.errors += 1
+            else:
+                result.latencies.setdefault(path, []).append(elapsed)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError,
+                ValueError, IndexError):
+            result.errors += 1
+            close = True
+        if close and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _run(url, requests, concurrency, duration):
+    parts = urlsplit(url)
+    host = parts.hostname
+    port = parts.port or 80
+    result = Result()
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*[
+        _client(host, port, requests, deadline, result, n)
+        for n in range(concurrency)])
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def run(url, requests, concurrency=10, duration=10.0):
+    # requests is a list of (method, path, body bytes)
+    return asyncio.run(_run(url, requests, concurrency, duration))
@@ -0,0 +1,60 @@
+# Compares the indexed search engine against the original ILIKE views.
+#
+#   python -m benchmarks.search [num_venues] [term...]
+#
+# Requires migration 8f41d2b6c0a9. Rows are flushed inside a transaction that
+# is rolled back at the end.
+import sys
+from app import app
+from models import db, Venue
+import search
+from benchmarks import count_queries, timed
+
+WORDS = ['Musical', 'Hop', 'Park', 'Square', 'Live', 'Music', 'Coffee',
+         'Dueling', 'Pianos', 'Bar', 'Hall', 'Jazz', 'Club', 'Lounge']
+
+
+def seed(num_venues):
+    venues = []
+    for i in range(num_venues):
+        name = ' '.join(WORDS[(i * k) % len(WORDS)] for k in (1, 3, 7))
+        venues.append(Venue(name='%s %d' % (name, i), genres=['Jazz'],
+                            city='Austin', state='TX', address='1 Main St'))
+    db.session.add_all(venues)
+    db.session.flush()
+
+
+def ilike_search(term):
+    # the original search_venues() body: the query runs three times
+    results = db.session.query(Venue.id, Venue.name).filter(
+        Venue.name.ilike('%' + term + '%'))
+    results.all()
+    data = [{'id': vid, 'name': vname, 'num_upcoming_shows': 0}
+            for vid, vname in results]
+    return {'count': len(results.all()), 'data': data}
+
+
+def run(num_venues, terms):
+    print('%-12s %-8s %8s %8s %12s' % (
+        'term', 'path', 'results', 'queries', 'seconds'))
+    with app.app_context():
+        engine = db.get_engine()
+        try:
+            seed(num_venues)
+            db.session.execute('ANALYZE venues')
+            for term in terms:
+                for label, fn in (('ilike', ilike_search),
+                                  ('engine', search.search_venues)):
+                    with count_queries(engine) as counter, \
+                            timed() as timing:
+                        results = fn(term)
+                    print('%-12s %-8s %8d %8d %12.4f' % (
+                        term, label, results['count'], counter.count,
+                        timing['elapsed']))
+        finally:
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    run(size, sys.argv[2:] or ['Hop', 'music', 'jazz club', 'Lounge 99'])
@@ -0,0 +1,89 @@
+# Compares the WSGI and ASGI serving modes under concurrent load.
+#
+#   python -m benchmarks.serving [--workers 4] [--duration 15] [clients...]
+#
+# Starts `python serve.py <mode>` on a local port for each mode, replays the
+# read routes from benchmarks.suite at 50, 200 and 1000 concurrent clients
+# (or the counts given) and prints throughput and latency per mode. Load a
+# catalog with benchmarks.datagen first; 1000 clients needs `ulimit -n` well
+# above 1000.
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+from benchmarks import load
+from benchmarks.suite import build_requests, percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ['wsgi', 'asgi']
+READ_PREFIXES = ('/venues', '/artists/', '/shows')
+
+
+def read_requests(samples):
+    # the routes asgi.py serves itself, plus the searches
+    return [r for r in build_requests(samples)
+            if (r[0] == 'POST' or r[1].startswith(READ_PREFIXES)) and
+            '/edit' not in r[1] and '/create' not in r[1]]
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start on port %d' % port)
+
+
+def start(mode, port, workers):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), PORT=str(port),
+               SQL_PROFILING_ENABLED='0')
+    server = subprocess.Popen([sys.executable, 'serve.py', mode], cwd=ROOT,
+                              env=env, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    wait_for_port(port)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare serving modes.')
+    parser.add_argument('clients', nargs='*', type=int,
+                        default=[50, 200, 1000])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--samples', type=int, default=50)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    requests = read_requests(args.samples)
+    url = 'http://127.0.0.1:%d' % args.port
+    print('%-6s %8s %10s %9s %9s %8s' % (
+        'mode', 'clients', 'req/s', 'p50 ms', 'p99 ms', 'errors'))
+    for mode in MODES:
+        server = start(mode, args.port, args.workers)
+        try:
+            # warm caches and connection pools before measuring
+            load.run(url, requests, 10, 2.0)
+            for clients in args.clients:
+                result = load.run(url, requests, clients, args.duration)
+                latencies = [v for values in result.latencies.values()
+                             for v in values]
+                if not latencies:
+                    print('%-6s %8d %10s %9s %9s %8d' % (
+                        mode, clients, '-', '-', '-', result.errors))
+                    continue
+                print('%-6s %8d %10.1f %9.2f %9.2f %8d' % (
+                    mode, clients, result.count / result.elapsed,
+                    percentile(latencies, 50) * 1000,
+                    percentile(latencies, 99) * 1000, result.errors))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+# Time to first request after a worker starts, cold versus warm.
+#
+#   python -m benchmarks.startup [--rounds 3] [paths...]
+#   python -m benchmarks.startup --imports [--save-baseline F | --baseline F]
+#
+# cold: an empty template cache directory and no warm-up, as every deploy
+#       used to start.
+# warm: templates precompiled with `flask templates precompile` and
+#       WARMUP_ENABLED, so mappers, templates and pool connections are ready
+#       before the first request.
+#
+# For each, starts `python serve.py wsgi` with one worker, waits for the port
+# and times the first request to each path (the first hit on a page is the
+# one that compiles its templates and opens a connection), then the same
+# path a second time for reference.
+#
+# --imports instead measures the process itself: a `python -X importtime`
+# summary of `import app` and the wall clock from interpreter start to the
+# first test-client response, each in a fresh interpreter. With --baseline
+# the exit status is non-zero when either grew beyond --tolerance, so CI can
+# track it.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from benchmarks.serving import ROOT, wait_for_port
+
+PATHS = ['/', '/venues', '/shows', '/artists/1']
+
+# run by a fresh interpreter; time.perf_counter() starts near zero there, so
+# the first reading covers interpreter start too
+FIRST_REQUEST = """
+import json, time
+start = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+app.test_client().get('/')
+done = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000,
+                  'first_request_ms': (done - imported) * 1000,
+                  'total_ms': (done - start) * 1000}))
+"""
+
+
+def fetch(url):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            response.read()
+    except urllib.error.HTTPError as e:
+        e.read()
+    return time.perf_counter() - start
+
+
+def precompile(cache_dir):
+    env = dict(os.environ, TEMPLATE_CACHE_DIR=cache_dir, FLASK_APP='app.py')
+    subprocess.run([sys.executable, '-m', 'flask', 'templates', 'precompile'],
+                   cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL)
+
+
+def measure(paths, port, cache_dir, warm):
+    env = dict(os.environ, WEB_CONCURRENCY='1', PORT=str(port),
+               TEMPLATE_CACHE_DIR=cache_dir, WARMUP_ENABLED='1' if warm
+               else '0')
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, 'serve.py', 'wsgi'], cwd=ROOT,
+                              env=env, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        ready = time.perf_counter() - start
+        url = 'http://127.0.0.1:%d' % port
+        first = [fetch(url + path) for path in paths]
+        total = time.perf_counter() - start
+        second = [fetch(url + path) for path in paths]
+    finally:
+        server.terminate()
+        server.wait()
+    return ready, first, second, total
+
+
+def import_times(top):
+    # -X importtime writes "self us | cumulative us | name" per module, the
+    # name indented by nesting depth
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             'import app'], cwd=ROOT, capture_output=True,
+                            text=True, check=True).stderr
+    # a module is listed after everything it imported, so the depth 1 lines
+    # just above the "app" line are its imports
+    modules, children = {}, {}
+    total = 0.0
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split(':', 1)[1].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            children[name.strip()] = int(cumulative_us) / 1000
+        elif depth == 0:
+            if name.strip() == 'app':
+                modules, total = children, int(cumulative_us) / 1000
+            children = {}
+    ranked = sorted(modules.items(), key=lambda item: -item[1])[:top]
+    return total, ranked
+
+
+def first_request():
+    output = subprocess.run([sys.executable, '-c', FIRST_REQUEST], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def imports(args):
+    total, ranked = import_times(args.top)
+    best = None
+    for _ in range(args.rounds):
+        timing = first_request()
+        if best is None or timing['total_ms'] < best['total_ms']:
+            best = timing
+    print('%-28s %10s' % ('import app', 'cumul. ms'))
+    for name, ms in ranked:
+        print('  %-26s %10.1f' % (name, ms))
+    print('%-28s %10.1f' % ('total', total))
+    print('import app %.1fms, first request %.1fms, start to first '
+          'response %.1fms' % (best['import_ms'], best['first_request_ms'],
+                               best['total_ms']))
+    summary = dict(best, importtime_ms=total)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = ['%s %.1fms -> %.1fms' % (key, baseline[key],
+                                                 summary[key])
+                       for key in ('importtime_ms', 'total_ms')
+                       if summary[key] > baseline[key] * (1 + args.tolerance)]
+        for line in regressions:
+            print('REGRESSION ' + line)
+        if regressions:
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time to first request.')
+    parser.add_argument('paths', nargs='*', default=PATHS)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--imports', action='store_true',
+                        help='measure import time and in-process time to '
+                        'first request instead of a server')
+    parser.add_argument('--top', type=int, default=15,
+                        help='slowest imports of app.py to list')
+    parser.add_argument('--baseline', help='compare against this file')
+    parser.add_argument('--save-baseline', help='write results to this file')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+    if args.imports:
+        return imports(args)
+
+    print('%-5s %10s %-16s %10s %10s' % ('mode', 'ready ms', 'path',
+                                         'first ms', 'second ms'))
+    for mode in ('cold', 'warm'):
+        best = None
+        for _ in range(args.rounds):
+            with tempfile.TemporaryDirectory() as cache_dir:
+                if mode == 'warm':
+                    precompile(cache_dir)
+                result = measure(args.paths, args.port, cache_dir,
+                                 mode == 'warm')
+            if best is None or result[3] < best[3]:
+                best = result
+        ready, first, second, total = best
+        for i, path in enumerate(args.paths):
+            print('%-5s %10s %-16s %10.1f %10.1f' % (
+                mode, '%.1f' % (ready * 1000) if i == 0 else '', path,
+                first[i] * 1000, second[i] * 1000))
+        print('%-5s time to last first response: %.1fms' % (mode,
+                                                             total * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+# Drives every read route of app.py and reports latency percentiles, queries
+# per request and throughput.
+#
+#   python -m benchmarks.suite                       # in-process test client
+#   python -m benchmarks.suite --url http://127.0.0.1:5000 --concurrency 50
+#   python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+#   python -m benchmarks.suite --baseline benchmarks/baseline.json
+#
+# Run it against a catalog loaded with benchmarks.datagen so numbers are
+# comparable between runs. With --baseline the exit status is non-zero when
+# any route's p95 or query count regressed beyond --tolerance. Routes that
+# write (create, edit, delete) are left out so repeated runs see the same data.
+import argparse
+import json
+import sys
+import time
+from urllib.parse import urlencode
+from app import app
+from models import db, Venue, Artist
+from cache import cache, NullBackend
+from benchmarks import count_queries
+from benchmarks import load
+
+SEARCH_TERMS = ['blue', 'the', 'hall', 'san francisco, ca', 'zzz']
+
+
+def sample_ids(model, n):
+    # spread the sample across the id range rather than the first n rows
+    total = model.query.count()
+    step = max(1, total // n)
+    rows = db.session.query(model.id).order_by(model.id) \
+        .filter(model.id % step == 0).limit(n).all()
+    return [row.id for row in rows]
+
+
+def build_requests(samples):
+    with app.app_context():
+        venue_ids = sample_ids(Venue, samples)
+        artist_ids = sample_ids(Artist, samples)
+    requests = [('GET', path, b'') for path in (
+        '/', '/venues', '/artists', '/shows', '/shows?limit=100',
+        '/venues/create', '/artists/create', '/shows/create',
+        '/api/suggest?q=blu', '/api/v1/venues', '/api/v1/artists',
+        '/api/v1/shows')]
+    for venue_id in venue_ids:
+        requests += [('GET', '/venues/%d' % venue_id, b''),
+                     ('GET', '/venues/%d/edit' % venue_id, b''),
+                     ('GET', '/api/v1/venues/%d' % venue_id, b'')]
+    for artist_id in artist_ids:
+        requests += [('GET', '/artists/%d' % artist_id, b''),
+                     ('GET', '/artists/%d/edit' % artist_id, b''),
+                     ('GET', '/api/v1/artists/%d' % artist_id, b'')]
+    for term in SEARCH_TERMS:
+        body = urlencode({'search_term': term}).encode('utf-8')
+        requests += [('POST', '/venues/search', body),
+                     ('POST', '/artists/search', body)]
+    return requests
+
+
+def route_of(path):
+    # group /venues/12 and /venues/40 under one row of the report
+    parts = [('<id>' if p.isdigit() else p)
+             for p in path.split('?')[0].split('/')]
+    return '/'.join(parts)
+
+#----------------------------------------------------------------------------#
+# Runners.
+#----------------------------------------------------------------------------#
+
+
+def run_client(requests, rounds):
+    client = app.test_client()
+    engine = None
+    with app.app_context():
+        engine = db.get_engine()
+    latencies = {}
+    queries = {}
+    errors = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for method, path, body in requests:
+            with count_queries(engine) as counter:
+                begin = time.perf_counter()
+                response = client.open(
+                    path, method=method, data=body or None,
+                    content_type='application/x-www-form-urlencoded')
+                elapsed = time.perf_counter() - begin
+            if response.status_code >= 500:
+                errors += 1
+                continue
+            route = route_of(path)
+            latencies.setdefault(route, []).append(elapsed)
+            queries.setdefault(route, []).append(counter.count)
+    return latencies, queries, errors, time.perf_counter() - start
+
+
+def run_http(url, requests, concurrency, duration):
+    result = load.run(url, requests, concurrency, duration)
+    latencies = {}
+    for path, values in result.latencies.items():
+        latencies.setdefault(route_of(path), []).extend(values)
+    return latencies, {}, result.errors, result.elapsed
+
+#----------------------------------------------------------------------------#
+# Reporting.
+#----------------------------------------------------------------------------#
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, queries, elapsed):
+    routes = {}
+    for route, values in sorted(latencies.items()):
+        counts = queries.get(route)
+        routes[route] = {
+            'requests': len(values),
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p95_ms': round(percentile(values, 95) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+            'queries': max(counts) if counts else None,
+        }
+    total = sum(len(v) for v in latencies.values())
+    return {'routes': routes, 'requests': total,
+            'throughput_rps': round(total / elapsed, 1) if elapsed else 0}
+
+
+def print_report(summary, errors):
+    print('%-28s %8s %9s %9s %9s %8s' % (
+        'route', 'requests', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+    for route, row in summary['routes'].items():
+        print('%-28s %8d %9.2f %9.2f %9.2f %8s' % (
+            route, row['requests'], row['p50_ms'], row['p95_ms'],
+            row['p99_ms'], '-' if row['queries'] is None else row['queries']))
+    print('%d requests, %.1f req/s, %d errors' % (
+        summary['requests'], summary['throughput_rps'], errors))
+
+
+def compare(summary, baseline, tolerance):
+    # p95 may drift by the tolerance; query counts must not grow at all
+    regressions = []
+    for route, old in baseline['routes'].items():
+        new = summary['routes'].get(route)
+        if new is None:
+            continue
+        if new['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions.append('%s p95 %.2fms -> %.2fms' % (
+                route, old['p95_ms'], new['p95_ms']))
+        if None not in (old['queries'], new['queries']) and \
+                new['queries'] > old['queries']:
+            regressions.append('%s queries %d -> %d' % (
+                route, old['queries'], new['queries']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every route.')
+    parser.add_argument('--url', help='load an already running server over '
+                        'HTTP instead of using the test client')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='seconds of HTTP load')
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='passes over every route with the test client')
+    parser.add_argument('--samples', type=int, default=20,
+                        help='venues and artists sampled for detail pages')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='bypass the payload and page caches')
+    parser.add_argument('--baseline', help='compare against this file')
+    parser.add_argument('--save-baseline', help='write results to this file')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.no_cache:
+        app.config['PAGE_CACHE_ENABLED'] = False
+        cache.backend = NullBackend()
+    requests = build_requests(args.samples)
+    if args.url:
+        latencies, queries, errors, elapsed = run_http(
+            args.url, requests, args.concurrency, args.duration)
+    else:
+        latencies, queries, errors, elapsed = run_client(requests, args.rounds)
+    summary = summarize(latencies, queries, elapsed)
+    print_report(summary, errors)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(summary, json.load(f), args.tolerance)
+        for line in regressions:
+            print('REGRESSION ' + line)
+        if regressions:
+            sys.exit(1)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Measures the /venues directory query as the catalog grows.
+#
+#   python -m benchmarks.venues [sizes...]
+#
+# Rows are flushed inside a transaction that is rolled back at the end, so the
+# benchmark can be pointed at a development database.
+import sys
+from datetime import datetime, timezone
+from app import app
+from models import db, Venue, Artist, Show
+import queries
+from benchmarks import count_queries, timed
+
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'),
+          ('Seattle', 'WA'), ('Chicago', 'IL')]
+
+
+def seed(num_venues, shows_per_venue=3):
+    artist = Artist(name='Benchmark Artist', genres=['Jazz'], city='Austin',
+                    state='TX', phone=None, image_link=None, website=None,
+                    facebook_link=None)
+    db.session.add(artist)
+    venues = []
+    for i in range(num_venues):
+        city, state = CITIES[i % len(CITIES)]
+        venues.append(Venue(name='Benchmark Venue %d' % i, genres=['Jazz'],
+                            city=city, state=state, address='1 Main St'))
+    db.session.add_all(venues)
+    db.session.flush()
+    shows = []
+    for venue in venues:
+        for j in range(shows_per_venue):
+            start_time = datetime(2010 + j * 10, 1, 1, 20, tzinfo=timezone.utc)
+            shows.append(Show(venue_id=venue.id, artist_id=artist.id,
+                              start_time=start_time))
+    db.session.add_all(shows)
+    db.session.flush()
+
+
+def run(sizes):
+    print('%10s %10s %12s' % ('venues', 'queries', 'seconds'))
+    with app.app_context():
+        engine = db.get_engine()
+        try:
+            seeded = 0
+            for size in sizes:
+                seed(size - seeded)
+                seeded = size
+                with count_queries(engine) as counter, timed() as timing:
+                    queries.venue_areas()
+                print('%10d %10d %12.4f' % (size, counter.count,
+                                            timing['elapsed']))
+        finally:
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 10000])
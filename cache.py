@@ -0,0 +1,172 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+#----------------------------------------------------------------------------#
+# Backends.
+#----------------------------------------------------------------------------#
+
+_MISSING = object()
+
+
+class NullBackend(object):
+    def get(self, key):
+        return _MISSING
+
+    def set(self, key, value, timeout):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def incr(self, key, delta=1):
+        return 0
+
+    def clear(self):
+        pass
+
+
+class MemoryBackend(object):
+    # LRU dict of key -> (expires_at, value), bounded to max_entries.
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        expires_at = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def incr(self, key, delta=1):
+        # counters never expire; an evicted counter restarts from zero
+        with self._lock:
+            entry = self._data.get(key)
+            value = (entry[1] if entry else 0) + delta
+            self._data[key] = (None, value)
+            self._data.move_to_end(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend(object):
+    # Any Redis-compatible server; eviction is left to its maxmemory-policy
+    # (allkeys-lru) and expiry to per-key TTLs.
+    def __init__(self, url, prefix='fyyur:'):
+        import redis
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        if raw is None:
+            return _MISSING
+        return pickle.loads(raw)
+
+    def set(self, key, value, timeout):
+        self._client.set(self.prefix + key, pickle.dumps(value),
+                         ex=timeout or None)
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*[self.prefix + key for key in keys])
+
+    def incr(self, key, delta=1):
+        # stored as a plain redis integer, so only read it through incr()
+        return self._client.incrby(self.prefix + key, delta)
+
+    def clear(self):
+        keys = list(self._client.scan_iter(self.prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+#----------------------------------------------------------------------------#
+# Cache.
+#----------------------------------------------------------------------------#
+
+
+class Cache(object):
+    def __init__(self, backend=None, default_timeout=300):
+        self.backend = backend or MemoryBackend()
+        self.default_timeout = default_timeout
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        cache_type = app.config.get('CACHE_TYPE', 'memory')
+        if cache_type == 'redis':
+            self.backend = RedisBackend(app.config['CACHE_REDIS_URL'])
+        elif cache_type == 'null':
+            self.backend = NullBackend()
+        else:
+            self.backend = MemoryBackend(
+                app.config.get('CACHE_MAX_ENTRIES', 1024))
+        self.default_timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+        app.extensions['cache'] = self
+
+    def get(self, key, default=None):
+        value = self.backend.get(key)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        self.backend.set(key, value, timeout)
+
+    def get_or_set(self, key, load, timeout=None):
+        # None results (e.g. unknown ids) are returned but never stored.
+        value = self.backend.get(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = load()
+        if value is not None:
+            self.set(key, value, timeout)
+        return value
+
+    def delete(self, *keys):
+        self.backend.delete(*keys)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+        }
+
+
+cache = Cache()
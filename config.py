@@ -1,13 +1,224 @@
 import os
-SECRET_KEY = os.urandom(32)
+from sqlalchemy.pool import NullPool
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+#----------------------------------------------------------------------------#
+# Profiles.
+#----------------------------------------------------------------------------#
+
+# FYYUR_ENV picks one of these profiles; any value below can still be
+# overridden through the environment variable named next to it.
+profiles = {
+    'dev': {
+        'debug': True,
+        'database_url': 'postgresql://shreyaasridhar@localhost:5432/fyyur',
+        'pool_size': 5,
+        'max_overflow': 5,
+        'pool_recycle': -1,
+        'statement_timeout_ms': 0,
+    },
+    'test': {
+        'debug': False,
+        'database_url':
+            'postgresql://shreyaasridhar@localhost:5432/fyyur_test',
+        'pool_size': 2,
+        'max_overflow': 0,
+        'pool_recycle': -1,
+        'statement_timeout_ms': 5000,
+    },
+    'prod': {
+        'debug': False,
+        'database_url': None,
+        'pool_size': 10,
+        'max_overflow': 5,
+        # below typical load balancer and server idle cutoffs
+        'pool_recycle': 1800,
+        'statement_timeout_ms': 10000,
+    },
+}
+
+FYYUR_ENV = os.environ.get('FYYUR_ENV', 'dev')
+if FYYUR_ENV not in profiles:
+    raise RuntimeError('FYYUR_ENV must be one of %s, not %r' % (
+        ', '.join(sorted(profiles)), FYYUR_ENV))
+_profile = profiles[FYYUR_ENV]
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return default if value in (None, '') else int(value)
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
 # Enable debug mode.
-DEBUG = True
+DEBUG = _env_bool('FLASK_DEBUG', _profile['debug'])
+TESTING = FYYUR_ENV == 'test'
 
-# Connect to the database
+# Must be identical in every worker, or sessions and CSRF tokens signed by
+# one process are rejected by the others.
+SECRET_KEY = os.environ.get('SECRET_KEY')
+if not SECRET_KEY:
+    if FYYUR_ENV == 'prod':
+        raise RuntimeError('SECRET_KEY must be set when FYYUR_ENV=prod')
+    SECRET_KEY = 'fyyur-%s-not-secret' % FYYUR_ENV
 
+#----------------------------------------------------------------------------#
+# Database.
+#----------------------------------------------------------------------------#
 
 # DONE IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql://shreyaasridhar@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL',
+                                         _profile['database_url'])
+if not SQLALCHEMY_DATABASE_URI:
+    raise RuntimeError('DATABASE_URL must be set when FYYUR_ENV=%s' % FYYUR_ENV)
+# heroku style URLs use a scheme sqlalchemy 1.4 no longer accepts
+if SQLALCHEMY_DATABASE_URI.startswith('postgres://'):
+    SQLALCHEMY_DATABASE_URI = 'postgresql://' + \
+        SQLALCHEMY_DATABASE_URI[len('postgres://'):]
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Each worker process holds up to DB_POOL_SIZE + DB_MAX_OVERFLOW
+# connections; WEB_CONCURRENCY is the number of workers, used only for the
+# startup report.
+DB_POOL_SIZE = _env_int('DB_POOL_SIZE', _profile['pool_size'])
+DB_MAX_OVERFLOW = _env_int('DB_MAX_OVERFLOW', _profile['max_overflow'])
+DB_POOL_TIMEOUT = _env_int('DB_POOL_TIMEOUT', 10)
+DB_POOL_RECYCLE = _env_int('DB_POOL_RECYCLE', _profile['pool_recycle'])
+DB_POOL_PRE_PING = _env_bool('DB_POOL_PRE_PING', FYYUR_ENV == 'prod')
+DB_STATEMENT_TIMEOUT_MS = _env_int('DB_STATEMENT_TIMEOUT_MS',
+                                   _profile['statement_timeout_ms'])
+DB_CONNECT_TIMEOUT = _env_int('DB_CONNECT_TIMEOUT', 5)
+WEB_CONCURRENCY = _env_int('WEB_CONCURRENCY', 1)
+
+# Behind PgBouncer in transaction mode the bouncer owns pooling, so the app
+# opens a connection per checkout (NullPool) and sends no startup options,
+# which PgBouncer rejects; the statement timeout is applied per transaction
+# with SET LOCAL instead (see pooling.py).
+PGBOUNCER = _env_bool('PGBOUNCER', False)
+
+if PGBOUNCER:
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'poolclass': NullPool,
+        'connect_args': {'connect_timeout': DB_CONNECT_TIMEOUT},
+    }
+else:
+    _options = '-c application_name=fyyur'
+    if DB_STATEMENT_TIMEOUT_MS:
+        _options += ' -c statement_timeout=%d' % DB_STATEMENT_TIMEOUT_MS
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        'connect_args': {'connect_timeout': DB_CONNECT_TIMEOUT,
+                         'options': _options},
+    }
+
+# Read replicas for GET/HEAD views, comma separated. A replica lagging more
+# than DB_REPLICA_MAX_LAG seconds is skipped until its next check, and a
+# client that just wrote reads from the primary for DB_STICKY_SECONDS. Lag is
+# checked in the background every DB_REPLICA_CHECK_INTERVAL seconds; a check
+# gives up after DB_REPLICA_PROBE_TIMEOUT (libpq's minimum is 2).
+DB_REPLICA_URLS = [url.strip() for url in
+                   os.environ.get('DB_REPLICA_URLS', '').split(',')
+                   if url.strip()]
+DB_REPLICA_MAX_LAG = _env_int('DB_REPLICA_MAX_LAG', 5)
+DB_REPLICA_CHECK_INTERVAL = _env_int('DB_REPLICA_CHECK_INTERVAL', 5)
+DB_REPLICA_PROBE_TIMEOUT = _env_int('DB_REPLICA_PROBE_TIMEOUT', 2)
+DB_STICKY_SECONDS = _env_int('DB_STICKY_SECONDS', 5)
+
+# Serve /venues and /shows from the venue_areas_mv and show_listing_mv
+# materialized views. They are refreshed by `flask matviews refresh` on a
+# schedule and, unless disabled, in the background a few seconds after a
+# write, so listings trail writes by about MATERIALIZED_VIEWS_REFRESH_DELAY.
+MATERIALIZED_VIEWS_ENABLED = _env_bool('MATERIALIZED_VIEWS_ENABLED', False)
+MATERIALIZED_VIEWS_REFRESH_ON_WRITE = True
+MATERIALIZED_VIEWS_REFRESH_DELAY = 5
+
+# Fetch a detail page's entity, upcoming shows and past shows in parallel on
+# separate connections (see fanout.py). Each request holds at most
+# FANOUT_PER_REQUEST extra connections on top of its own, and
+# FANOUT_MAX_WORKERS threads do this per process, so leave that much headroom
+# in DB_POOL_SIZE. Off until `python -m benchmarks.fanout` has shown it to pay
+# off against PostgreSQL; it has not been measured yet.
+DETAIL_FANOUT_ENABLED = _env_bool('DETAIL_FANOUT_ENABLED', False)
+FANOUT_MAX_WORKERS = _env_int('FANOUT_MAX_WORKERS', 4)
+FANOUT_PER_REQUEST = 2
+
+#----------------------------------------------------------------------------#
+# Caching and profiling.
+#----------------------------------------------------------------------------#
+
+# Cache for assembled venue/artist detail payloads.
+# CACHE_TYPE is one of 'memory', 'redis' or 'null'.
+CACHE_TYPE = os.environ.get('CACHE_TYPE',
+                            'null' if FYYUR_ENV == 'test' else 'memory')
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_DEFAULT_TIMEOUT = 300
+CACHE_MAX_ENTRIES = 1024
+
+# Rendered HTML of the public listing pages, revalidated with ETags. With
+# the memory backend a worker also drops its data version after
+# PAGE_CACHE_TIMEOUT, since writes made by other workers or by the flask
+# commands never reach it (see page_cache.py). The async pages of
+# `serve.py asgi` are not cached.
+PAGE_CACHE_ENABLED = FYYUR_ENV != 'test'
+PAGE_CACHE_TIMEOUT = 60
+
+# Per-request SQL profiling: Server-Timing headers, one structured log line
+# per request, and a warning when a statement shape repeats more than
+# SQL_NPLUSONE_THRESHOLD times in one request. Not for the async pages of
+# `serve.py asgi`.
+SQL_PROFILING_ENABLED = _env_bool('SQL_PROFILING_ENABLED', True)
+SQL_NPLUSONE_THRESHOLD = 10
+SQL_SLOW_QUERY_MS = 100
+
+# Dates render in the request's best Accept-Language match among
+# SUPPORTED_LOCALES, and in the timezone named by the `tz` cookie, falling
+# back to DISPLAY_TIMEZONE (None keeps the offset the value was stored with).
+DISPLAY_LOCALE = 'en_US'
+SUPPORTED_LOCALES = ['en_US']
+DISPLAY_TIMEZONE = os.environ.get('DISPLAY_TIMEZONE') or None
+
+# `flask assets build` writes bundled, fingerprinted and precompressed copies
+# of static/ to static/dist; templates link to them once they exist. Their
+# names change whenever their content does, so browsers may keep them this
+# long without revalidating.
+ASSETS_MAX_AGE = 365 * 24 * 3600
+
+# Artist and venue images are fetched once through /images, resized to one of
+# IMAGE_PROXY_WIDTHS and kept in IMAGE_CACHE_DIR, which is trimmed back when
+# it grows past IMAGE_CACHE_MAX_BYTES. Links resolving to private addresses
+# are refused unless IMAGE_PROXY_ALLOW_PRIVATE (a local stand-in in tests).
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR',
+                                 os.path.join(basedir, '.image_cache'))
+IMAGE_CACHE_MAX_BYTES = _env_int('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+IMAGE_PROXY_WIDTHS = [360, 560, 720, 1120]
+IMAGE_PROXY_MAX_BYTES = 10 * 1024 * 1024
+IMAGE_PROXY_TIMEOUT = 5
+IMAGE_PROXY_MAX_AGE = 30 * 24 * 3600
+IMAGE_PROXY_ALLOW_PRIVATE = _env_bool('IMAGE_PROXY_ALLOW_PRIVATE',
+                                      FYYUR_ENV == 'test')
+
+#----------------------------------------------------------------------------#
+# Startup.
+#----------------------------------------------------------------------------#
+
+# Compiled templates are kept here and shared by all workers; fill it at
+# build time with `flask templates precompile`. Entries are keyed on the
+# template source, so an edited template is simply recompiled.
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR',
+                                    os.path.join(basedir, '.jinja_cache'))
+# Before serving, configure the mappers and load every template, and have
+# each worker open WARMUP_CONNECTIONS pool connections (see gunicorn.conf.py)
+# so the first requests after a deploy do not pay for any of it.
+WARMUP_ENABLED = _env_bool('WARMUP_ENABLED', FYYUR_ENV == 'prod')
+WARMUP_CONNECTIONS = _env_int('WARMUP_CONNECTIONS', 2)
@@ -0,0 +1,140 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from models import db
+import page_cache
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# venues/artists.upcoming_shows_count and past_shows_count are kept by the
+# show_counters_update trigger (migration d5a8e3c1f6b2) relative to the
+# watermark in show_counter_watermark. Rolling moves the watermark up to now,
+# so the counts are exact as of the last roll; run it from cron every minute
+# or so. Every change to the counts also bumps updated_at (migration
+# f3c8a2b6d4e1), so incremental exports pick them up.
+TABLES = (('venues', 'venue_id'), ('artists', 'artist_id'))
+
+ROLL_SQL = """
+    UPDATE {table} t SET
+        upcoming_shows_count = t.upcoming_shows_count - s.n,
+        past_shows_count = t.past_shows_count + s.n,
+        updated_at = now()
+    FROM (
+        SELECT {fk}, count(*) AS n FROM shows
+        WHERE start_time > :rolled_from AND start_time <= :rolled_to
+        GROUP BY {fk}
+    ) s
+    WHERE s.{fk} = t.id
+"""
+
+# expected counts for every row, including ones with no shows left; the
+# watermark is read in the same statement so both come from one snapshot
+EXPECTED_SQL = """
+    SELECT x.id, x.upcoming_shows_count, x.past_shows_count,
+           coalesce(s.upcoming, 0) AS upcoming, coalesce(s.past, 0) AS past
+    FROM {table} x LEFT JOIN (
+        SELECT {fk},
+               count(*) FILTER (WHERE start_time > w.rolled_at) AS upcoming,
+               count(*) FILTER (WHERE start_time <= w.rolled_at) AS past
+        FROM shows, show_counter_watermark w GROUP BY {fk}
+    ) s ON s.{fk} = x.id
+    WHERE x.upcoming_shows_count <> coalesce(s.upcoming, 0)
+       OR x.past_shows_count <> coalesce(s.past, 0)
+"""
+
+FIX_SQL = """
+    UPDATE {table} t SET
+        upcoming_shows_count = e.upcoming,
+        past_shows_count = e.past,
+        updated_at = now()
+    FROM ({expected}) e
+    WHERE e.id = t.id
+"""
+
+
+def _lock_watermark():
+    # FOR UPDATE waits out transactions whose trigger holds the row FOR SHARE
+    # and keeps new ones out until we commit
+    return db.session.execute(text(
+        'SELECT rolled_at FROM show_counter_watermark FOR UPDATE')).scalar()
+
+
+def roll():
+    # Moves shows that started since the last roll from upcoming to past and
+    # returns the number of venue and artist rows changed.
+    rolled_from = _lock_watermark()
+    # clock_timestamp, not now(): now() is when the transaction started,
+    # which may be before the lock was granted
+    rolled_to = db.session.execute(text('SELECT clock_timestamp()')).scalar()
+    changed = 0
+    for table, fk in TABLES:
+        changed += db.session.execute(
+            text(ROLL_SQL.format(table=table, fk=fk)),
+            {'rolled_from': rolled_from, 'rolled_to': rolled_to}).rowcount
+    db.session.execute(text(
+        'UPDATE show_counter_watermark SET rolled_at = :rolled_to'),
+        {'rolled_to': rolled_to})
+    db.session.commit()
+    return changed
+
+
+def check(fix=False):
+    # Returns {table: [(id, stored upcoming, stored past, upcoming, past)]}
+    # for every row that disagrees with the shows table, correcting them
+    # first if fix is set.
+    if fix:
+        _lock_watermark()
+    mismatches = {}
+    for table, fk in TABLES:
+        expected = EXPECTED_SQL.format(table=table, fk=fk)
+        rows = db.session.execute(text(expected)).fetchall()
+        mismatches[table] = [tuple(row) for row in rows]
+        if fix and rows:
+            db.session.execute(text(FIX_SQL.format(table=table,
+                                                   expected=expected)))
+    db.session.commit()
+    return mismatches
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+
+@click.group('counters')
+def counters_command():
+    """Maintain the denormalized show counters."""
+
+
+@counters_command.command('roll')
+@with_appcontext
+def roll_command():
+    """Roll shows that have started from upcoming to past."""
+    changed = roll()
+    if changed:
+        page_cache.bump()
+    click.echo('%d rows updated' % changed)
+
+
+@counters_command.command('check')
+@click.option('--fix', is_flag=True, help='Correct any drifted counters.')
+@with_appcontext
+def check_command(fix):
+    """Verify the counters against the shows table."""
+    mismatches = check(fix)
+    total = 0
+    for table, rows in mismatches.items():
+        for row_id, upcoming, past, expected_upcoming, expected_past in rows:
+            click.echo('%s %d: upcoming %d (expected %d), past %d '
+                       '(expected %d)' % (table, row_id, upcoming,
+                                          expected_upcoming, past,
+                                          expected_past))
+        total += len(rows)
+    if not total:
+        click.echo('counters are consistent')
+    elif fix:
+        page_cache.bump()
+        click.echo('%d rows corrected' % total)
+    else:
+        raise SystemExit(1)
@@ -0,0 +1,187 @@
+import csv
+import io
+import itertools
+import json
+import sys
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Rows.
+#----------------------------------------------------------------------------#
+
+ENTITIES = {
+    'venues': Venue,
+    'artists': Artist,
+    'shows': Show,
+}
+FORMATS = ['csv', 'jsonl', 'parquet']
+BATCH_SIZE = 1000
+
+
+def columns(entity):
+    return [c for c in ENTITIES[entity].__table__.columns
+            if c.name != 'search_vector']
+
+
+def export_rows(entity, since=None, batch_size=BATCH_SIZE):
+    # A server-side cursor (stream_results) fetched batch_size rows at a time,
+    # so memory stays flat no matter how large the table is. `since` exports
+    # only rows changed at or after that watermark.
+    model = ENTITIES[entity]
+    query = db.session.query(*columns(entity))
+    if since is not None:
+        query = query.filter(model.updated_at >= since)
+    query = query.order_by(model.id).execution_options(
+        stream_results=True).yield_per(batch_size)
+    for row in query:
+        yield row
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _csv_value(value):
+    # lists and booleans in the shapes `flask import` reads back
+    if isinstance(value, list):
+        return ','.join(value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return _value(value)
+
+#----------------------------------------------------------------------------#
+# Writers.
+#----------------------------------------------------------------------------#
+
+
+def csv_chunks(entity, rows, batch_size=BATCH_SIZE):
+    names = [c.name for c in columns(entity)]
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(names)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow([_csv_value(v) for v in row])
+        if i % batch_size == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def jsonl_chunks(entity, rows, batch_size=BATCH_SIZE):
+    names = [c.name for c in columns(entity)]
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(
+            (name, _value(value)) for name, value in zip(names, row))))
+        if len(lines) >= batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def write_parquet(entity, rows, path, batch_size=BATCH_SIZE):
+    # one row group per batch; pyarrow is only needed for this format
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    names = [c.name for c in columns(entity)]
+    rows = iter(rows)
+    writer = None
+    try:
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            table = pa.Table.from_pylist(
+                [dict(zip(names, row)) for row in batch],
+                schema=writer.schema if writer else None)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+CHUNKERS = {
+    'csv': (csv_chunks, 'text/csv'),
+    'jsonl': (jsonl_chunks, 'application/x-ndjson'),
+}
+
+
+def parse_since(value):
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
+#----------------------------------------------------------------------------#
+# CLI.
+#----------------------------------------------------------------------------#
+
+
+# Rows carry updated_at = now(), the start of the transaction that wrote
+# them, and a long transaction can commit after rows with later timestamps
+# were already exported. So the watermark for the next run is read before
+# the export starts: the current time, or the start of the oldest
+# transaction still open if that is earlier. Everything committed later has
+# an updated_at at or after it. The overlap can repeat rows, so consumers
+# should upsert by id. Other roles' transactions are only visible here with
+# pg_read_all_stats.
+WATERMARK_SQL = text("""
+    SELECT least(clock_timestamp(), min(xact_start))
+    FROM pg_stat_activity
+    WHERE datname = current_database() AND pid <> pg_backend_pid()
+      AND xact_start IS NOT NULL
+""")
+
+
+class _Counted(object):
+    # passes rows through while counting them
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
+
+
+@click.command('export')
+@click.argument('entity', type=click.Choice(sorted(ENTITIES)))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='jsonl',
+              show_default=True)
+@click.option('--since', help='Only rows updated at or after this ISO '
+              'timestamp.')
+@click.option('--output', '-o', default='-', show_default=True,
+              help='File to write, - for stdout (csv/jsonl only).')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True)
+@with_appcontext
+def export_command(entity, fmt, since, output, batch_size):
+    """Stream venues, artists or shows to CSV, JSONL or Parquet."""
+    watermark = db.session.execute(WATERMARK_SQL).scalar()
+    rows = _Counted(export_rows(entity, parse_since(since), batch_size))
+    if fmt == 'parquet':
+        if output == '-':
+            raise click.UsageError('parquet needs --output')
+        write_parquet(entity, rows, output, batch_size)
+    else:
+        chunker = CHUNKERS[fmt][0]
+        out = sys.stdout if output == '-' else open(output, 'w', newline='')
+        try:
+            for chunk in chunker(entity, rows, batch_size):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    # pass this back as --since for the next incremental run
+    click.echo('exported %d rows, watermark %s' % (rows.count,
+                                                    watermark.isoformat()),
+               err=True)
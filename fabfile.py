@@ -5,14 +5,39 @@ from fabric.contrib.console import confirm
 
 
 def test():
+    # needs no database; see tests/conftest.py
+    with settings(warn_only=True):
+        result = local("python -m pytest -q", capture=True)
+    if result.failed and not confirm("Tests failed. Continue?"):
+        abort("Aborted at user request.")
+
+
+def benchmark():
+    local("python -m benchmarks.suite --save-baseline benchmarks/baseline.json")
+    local("python -m benchmarks.startup --imports "
+          "--save-baseline benchmarks/startup.json")
+
+
+def compare():
+    # against the baselines `fab benchmark` saved; needs the benchmark
+    # database loaded with benchmarks.datagen
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python -m benchmarks.detail && "
+            "python -m benchmarks.suite --baseline benchmarks/baseline.json && "
+            "python -m benchmarks.startup --imports "
+            "--baseline benchmarks/startup.json",
+            capture=True
         )
-    if result.failed and not confirm("Tests failed. Continue?"):
+    if result.failed and not confirm("Benchmarks regressed. Continue?"):
         abort("Aborted at user request.")
 
 
+def build():
+    local("flask assets build")
+    local("flask templates precompile")
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -39,9 +64,7 @@ def heroku():
 
 
 def heroku_test():
-    local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
-    )
+    local("heroku run python -m benchmarks.detail")
 
 
 def deploy():
@@ -0,0 +1,67 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.orm import Session
+
+#----------------------------------------------------------------------------#
+# Parallel reads.
+#----------------------------------------------------------------------------#
+
+# Independent read statements of one request run side by side, each on its
+# own pooled connection. A process-wide executor caps the threads doing this,
+# and a per-call limit caps how many connections one request holds at once,
+# so a single page cannot drain the pool that other requests need.
+MAX_WORKERS = 8
+PER_REQUEST = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS,
+                                           thread_name_prefix='fanout')
+    return _executor
+
+
+def configure(max_workers=MAX_WORKERS, per_request=PER_REQUEST):
+    # Every create_app() calls this, so the executor is only replaced, and
+    # the old one shut down, when the limits actually change.
+    global MAX_WORKERS, PER_REQUEST, _executor
+    with _executor_lock:
+        if (max_workers, per_request) == (MAX_WORKERS, PER_REQUEST):
+            return
+        MAX_WORKERS = max_workers
+        PER_REQUEST = per_request
+        previous, _executor = _executor, None
+    if previous is not None:
+        previous.shutdown(wait=False)
+
+
+def run(engine, tasks, limit=None):
+    # Calls each task with a fresh Session bound to `engine` and returns
+    # their results in order. The engine is passed in rather than looked up,
+    # so the caller decides primary or replica. Each task runs in a copy of
+    # the caller's context, so request-scoped SQL profiling still sees it.
+    limit = max(1, min(limit or PER_REQUEST, len(tasks) or 1))
+    results = [None] * len(tasks)
+    slots = threading.BoundedSemaphore(limit)
+
+    def call(i, task):
+        try:
+            with Session(bind=engine) as session:
+                results[i] = task(session)
+        finally:
+            slots.release()
+
+    futures = []
+    for i, task in enumerate(tasks):
+        slots.acquire()
+        context = contextvars.copy_context()
+        futures.append(executor().submit(context.run, call, i, task))
+    for future in futures:
+        future.result()
+    return results
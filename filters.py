@@ -0,0 +1,123 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+import babel.dates
+from babel import Locale
+from flask import current_app, g, has_request_context, request
+from jinja2 import pass_context
+
+#----------------------------------------------------------------------------#
+# Date formatting.
+#----------------------------------------------------------------------------#
+
+PATTERNS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+# babel's own named formats, looked up per locale rather than parsed
+NAMED_FORMATS = ('long', 'short')
+FORMAT_CACHE_SIZE = 4096
+
+
+def parse_datetime(value):
+    # Values from the database are already datetimes; strings in the ISO
+    # shape we write take the C fromisoformat path, anything else dateutil.
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        import dateutil.parser
+        return dateutil.parser.parse(value)
+
+
+@lru_cache(maxsize=64)
+def _pattern(format):
+    return babel.dates.parse_pattern(PATTERNS.get(format, format))
+
+
+@lru_cache(maxsize=32)
+def _locale(identifier):
+    return Locale.parse(identifier)
+
+
+@lru_cache(maxsize=64)
+def _timezone(name):
+    return babel.dates.get_timezone(name)
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def _format(value, offset, format, locale, tz):
+    # offset is only part of the key: aware datetimes for the same instant
+    # compare equal even when they would print different local times
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    if tz:
+        value = value.astimezone(_timezone(tz))
+    if format in NAMED_FORMATS:
+        return babel.dates.format_datetime(value, format,
+                                           locale=_locale(locale))
+    return _pattern(format).apply(value, _locale(locale))
+
+
+def format_datetime(value, format='medium', locale=None, tz=None):
+    date = parse_datetime(value)
+    locale = locale or request_locale()
+    tz = tz or request_timezone()
+    return _format(date, date.utcoffset(), format, locale, tz)
+
+
+@pass_context
+def datetime_filter(context, value, format='medium'):
+    # The locale and timezone were put in the template context once per
+    # render (see init_app), which saves two context-local lookups per call.
+    date = parse_datetime(value)
+    return _format(date, date.utcoffset(), format,
+                   context.get('display_locale') or request_locale(),
+                   context.get('display_timezone'))
+
+#----------------------------------------------------------------------------#
+# Per-request locale and timezone.
+#----------------------------------------------------------------------------#
+
+
+def request_locale():
+    # best Accept-Language match among SUPPORTED_LOCALES, resolved once per
+    # request
+    config = current_app.config
+    if not has_request_context():
+        return config['DISPLAY_LOCALE']
+    if 'display_locale' not in g:
+        g.display_locale = request.accept_languages.best_match(
+            config['SUPPORTED_LOCALES']) or config['DISPLAY_LOCALE']
+    return g.display_locale
+
+
+def request_timezone():
+    # an IANA name from the timezone cookie, else DISPLAY_TIMEZONE; None
+    # keeps each value in the offset it was stored with
+    config = current_app.config
+    if not has_request_context():
+        return config['DISPLAY_TIMEZONE']
+    if 'display_timezone' not in g:
+        name = request.cookies.get(config['TIMEZONE_COOKIE'])
+        g.display_timezone = config['DISPLAY_TIMEZONE']
+        if name:
+            try:
+                _timezone(name)
+                g.display_timezone = name
+            except LookupError:
+                pass
+    return g.display_timezone
+
+
+def init_app(app):
+    app.config.setdefault('DISPLAY_LOCALE', 'en_US')
+    app.config.setdefault('SUPPORTED_LOCALES', [app.config['DISPLAY_LOCALE']])
+    app.config.setdefault('DISPLAY_TIMEZONE', None)
+    app.config.setdefault('TIMEZONE_COOKIE', 'tz')
+    app.jinja_env.filters['datetime'] = datetime_filter
+
+    @app.context_processor
+    def display_settings():
+        return {'display_locale': request_locale(),
+                'display_timezone': request_timezone()}
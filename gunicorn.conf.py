@@ -0,0 +1,49 @@
+# Gunicorn settings for both serving modes; see serve.py.
+import multiprocessing
+import os
+
+mode = os.environ.get('SERVE_MODE', 'wsgi')
+bind = os.environ.get('BIND', '0.0.0.0:%s' % os.environ.get('PORT', '5000'))
+
+# WEB_CONCURRENCY is also what config.py uses to report the total number of
+# database connections, so set it explicitly in production.
+workers = int(os.environ.get('WEB_CONCURRENCY',
+                             multiprocessing.cpu_count() * 2 + 1))
+if mode == 'asgi':
+    # one event loop per worker; concurrency comes from async I/O
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    # threads overlap DB waits within a worker; keep DB_POOL_SIZE at least
+    # this high or threads queue for connections
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+keepalive = 5
+timeout = 30
+graceful_timeout = 30
+# recycle workers now and then so slow leaks cannot accumulate; the jitter
+# keeps them from all restarting together
+max_requests = 2000
+max_requests_jitter = 200
+# import the app once in the master so workers fork with it already loaded
+preload_app = True
+# heartbeat files on tmpfs, not a possibly slow disk
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+accesslog = os.environ.get('ACCESS_LOG')
+
+
+def post_fork(server, worker):
+    # Engines created while preloading must not share sockets with the
+    # master; drop the inherited pool without closing the parent's sockets.
+    from app import app
+    from models import db
+    import warmup
+    with app.app_context():
+        db.get_engine().dispose(close=False)
+    replicas = app.extensions.get('fyyur_replicas')
+    if replicas is not None:
+        for replica in replicas.replicas:
+            replica.engine.dispose(close=False)
+    # each worker then connects ahead of its first request
+    if app.config['WARMUP_ENABLED']:
+        warmup.prime_pool(app, db)
@@ -0,0 +1,414 @@
+import fcntl
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import ssl
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urljoin, urlsplit
+from flask import Blueprint, current_app, request, send_file, url_for
+from itsdangerous import BadSignature, URLSafeSerializer
+from werkzeug.exceptions import NotFound
+from cache import cache
+
+#----------------------------------------------------------------------------#
+# Fetching.
+#----------------------------------------------------------------------------#
+
+# image_link is whatever URL a user typed in, so fetching it is guarded:
+# http(s) only, every address the host resolves to must be public (unless
+# IMAGE_PROXY_ALLOW_PRIVATE, for a local stand-in in tests), the connection
+# goes to the address that was checked, redirects are re-checked, the body is
+# capped at IMAGE_PROXY_MAX_BYTES and the whole fetch, redirects included, at
+# IMAGE_PROXY_TIMEOUT seconds.
+MAX_REDIRECTS = 3
+USER_AGENT = 'fyyur-image-proxy'
+READ_CHUNK = 64 * 1024
+
+
+class FetchError(Exception):
+    pass
+
+
+def _public(address):
+    address = ipaddress.ip_address(address)
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address.is_global
+
+
+def resolve(host, port, allow_private):
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise FetchError('cannot resolve %s: %s' % (host, e))
+    addresses = [info[4][0] for info in infos]
+    if not allow_private and not all(_public(a) for a in addresses):
+        raise FetchError('%s resolves to a non-public address' % host)
+    return addresses[0]
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    # connects to the vetted address, so a second DNS answer cannot differ
+    def __init__(self, host, port, address, timeout):
+        super().__init__(host, port, timeout=timeout)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port),
+                                             self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, host, port, address, timeout):
+        super().__init__(host, port, timeout=timeout,
+                         context=ssl.create_default_context())
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port),
+                                        self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+def _remaining(deadline, url):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise FetchError('fetching %s took too long' % url)
+    return remaining
+
+
+def _read(response, sock, max_bytes, deadline, url):
+    # The socket timeout bounds each recv, not the body, so a server sending
+    # a byte at a time could hold the fetch (and its key lock) far longer;
+    # every read gets only what is left of the deadline.
+    chunks = []
+    size = 0
+    while size <= max_bytes:
+        sock.settimeout(_remaining(deadline, url))
+        chunk = response.read1(min(READ_CHUNK, max_bytes + 1 - size))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    return b''.join(chunks)
+
+
+def fetch(url, max_bytes, timeout, allow_private=False):
+    deadline = time.monotonic() + timeout
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise FetchError('not an http(s) URL: %r' % url)
+        secure = parts.scheme == 'https'
+        port = parts.port or (443 if secure else 80)
+        address = resolve(parts.hostname, port, allow_private)
+        connection = (_PinnedHTTPSConnection if secure else
+                      _PinnedHTTPConnection)(parts.hostname, port, address,
+                                             _remaining(deadline, url))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        try:
+            connection.request('GET', path, headers={
+                'User-Agent': USER_AGENT, 'Accept': 'image/*'})
+            # getresponse() drops the connection's socket when the server
+            # will close it, but the response keeps reading from it
+            sock = connection.sock
+            sock.settimeout(_remaining(deadline, url))
+            response = connection.getresponse()
+            if response.status in (301, 302, 303, 307, 308):
+                url = urljoin(url, response.getheader('Location', ''))
+                continue
+            if response.status != 200:
+                raise FetchError('%s returned %d' % (url, response.status))
+            length = response.getheader('Content-Length')
+            if length and length.isdigit() and int(length) > max_bytes:
+                raise FetchError('%s is larger than %d bytes' % (url,
+                                                                  max_bytes))
+            body = _read(response, sock, max_bytes, deadline, url)
+            if len(body) > max_bytes:
+                raise FetchError('%s is larger than %d bytes' % (url,
+                                                                  max_bytes))
+            return body
+        except (OSError, http.client.HTTPException) as e:
+            raise FetchError('fetching %s failed: %s' % (url, e))
+        finally:
+            connection.close()
+    raise FetchError('too many redirects from %s' % url)
+
+#----------------------------------------------------------------------------#
+# Thumbnails.
+#----------------------------------------------------------------------------#
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 75, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 80, 'optimize': True,
+                                    'progressive': True}),
+}
+
+
+def thumbnail(data, width, format):
+    # Scaled to `width` (never up) with the aspect ratio kept; Pillow's
+    # decompression-bomb check rejects absurd pixel counts.
+    from PIL import Image, ImageOps
+    pil_format, _, options = FORMATS[format]
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((width, width * 4), Image.LANCZOS)
+            if image.mode not in ('RGB', 'RGBA') or format == 'jpeg':
+                image = image.convert('RGB')
+            output = io.BytesIO()
+            image.save(output, pil_format, **options)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise FetchError('not a usable image: %s' % e)
+    return output.getvalue()
+
+#----------------------------------------------------------------------------#
+# Disk cache.
+#----------------------------------------------------------------------------#
+
+
+class DiskCache(object):
+    # objects/ab/<sha256 of content>.<ext> holds each thumbnail once, however
+    # many URLs produce it; refs/ab/<sha256 of url, width, format> names the
+    # object for a request. Once the directory passes max_bytes, the least
+    # recently served objects and the refs naming them are removed down to
+    # 90%; a ref to a removed object is a miss and is fetched again.
+    #
+    # Every worker writes to the same directory, so usage is measured from
+    # the directory itself, by one process at a time under a file lock. A
+    # process looks again after it has written another CHECK_FRACTION of
+    # max_bytes, which bounds how far the workers together overshoot.
+    CHECK_FRACTION = 0.05
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # starts full, so the first write in a process measures
+        self._written = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, kind, digest, ext=''):
+        return os.path.join(self.directory, kind, digest[:2], digest + ext)
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def get(self, key):
+        try:
+            with open(self._path('refs', key)) as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return None
+        digest, ext = name.split('.')
+        path = self._path('objects', digest, '.' + ext)
+        try:
+            # the mtime is what eviction orders by
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path, digest
+
+    def set(self, key, data, ext):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path('objects', digest, '.' + ext)
+        written = 0
+        if not os.path.exists(path):
+            self._write(path, data)
+            written += len(data)
+        name = ('%s.%s' % (digest, ext)).encode('ascii')
+        self._write(self._path('refs', key), name)
+        self._grow(written + len(name))
+        return path, digest
+
+    def _files(self, kind):
+        for root, _, names in os.walk(os.path.join(self.directory, kind)):
+            for name in names:
+                if not name.startswith('.'):
+                    path = os.path.join(root, name)
+                    try:
+                        yield path, os.stat(path)
+                    except FileNotFoundError:
+                        pass
+
+    def _grow(self, size):
+        with self._lock:
+            self._written += size
+            if self._written < self.max_bytes * self.CHECK_FRACTION:
+                return
+            self._written = 0
+        self.evict()
+
+    def evict(self):
+        # Returns the number of objects removed; 0 as well when another
+        # process is already trimming.
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            return self._evict()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        # refs are listed before objects, so an object written in between
+        # only goes unreferenced rather than losing a fresh ref
+        refs = {}
+        for path, st in self._files('refs'):
+            try:
+                with open(path) as f:
+                    refs.setdefault(f.read().strip(), []).append((path, st))
+            except FileNotFoundError:
+                pass
+        objects = list(self._files('objects'))
+        used = sum(st.st_size for _, st in objects) + sum(
+            st.st_size for entries in refs.values() for _, st in entries)
+        if used <= self.max_bytes:
+            return 0
+
+        # refs to objects that are already gone only take up space
+        present = set(os.path.basename(path) for path, _ in objects)
+        for name in [name for name in refs if name not in present]:
+            for path, st in refs.pop(name):
+                self._remove(path)
+                used -= st.st_size
+
+        target = self.max_bytes * 0.9
+        removed = 0
+        for path, st in sorted(objects, key=lambda i: i[1].st_mtime):
+            if used <= target:
+                break
+            for ref, ref_st in refs.pop(os.path.basename(path), ()):
+                self._remove(ref)
+                used -= ref_st.st_size
+            self._remove(path)
+            used -= st.st_size
+            removed += 1
+        return removed
+
+#----------------------------------------------------------------------------#
+# Views.
+#----------------------------------------------------------------------------#
+
+images = Blueprint('images', __name__, url_prefix='/images')
+# misses are remembered this long so a dead link is not refetched per page
+FAILURE_TIMEOUT = 300
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'],
+                             salt='image-proxy')
+
+
+def thumbnail_url(url, width):
+    # Signed, so the proxy only ever fetches links the site rendered itself,
+    # at widths it allows. Anything that is not an absolute http(s) URL is
+    # returned unchanged.
+    if not url or urlsplit(url).scheme not in ('http', 'https'):
+        return url
+    if width not in current_app.config['IMAGE_PROXY_WIDTHS']:
+        raise ValueError('width must be one of %s' % (
+            current_app.config['IMAGE_PROXY_WIDTHS'],))
+    return url_for('images.proxy', token=_serializer().dumps([url, width]))
+
+
+# one fetch per key at a time; other requests for it wait and then read it
+# from disk. Each entry is [lock, holders and waiters], dropped by the last
+# of them, so a request arriving meanwhile still queues on the same lock.
+_fetching = {}
+_fetching_lock = threading.Lock()
+
+
+@contextmanager
+def _key_lock(key):
+    with _fetching_lock:
+        entry = _fetching.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _fetching_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _fetching[key]
+
+
+@images.route('/<token>')
+def proxy(token):
+    try:
+        url, width = _serializer().loads(token)
+    except (BadSignature, ValueError):
+        raise NotFound()
+    config = current_app.config
+    format = 'webp' if request.accept_mimetypes['image/webp'] else 'jpeg'
+    key = hashlib.sha256(('%s %d %s' % (url, width, format))
+                         .encode('utf-8')).hexdigest()
+    disk = current_app.extensions['images']
+
+    found = disk.get(key)
+    if found is None:
+        with _key_lock(key):
+            found = disk.get(key)
+            if found is None:
+                if cache.get('image-miss:' + key):
+                    raise NotFound()
+                try:
+                    data = thumbnail(fetch(
+                        url, config['IMAGE_PROXY_MAX_BYTES'],
+                        config['IMAGE_PROXY_TIMEOUT'],
+                        config['IMAGE_PROXY_ALLOW_PRIVATE']), width, format)
+                except FetchError as e:
+                    current_app.logger.info('image proxy: %s' % e)
+                    cache.set('image-miss:' + key, True, FAILURE_TIMEOUT)
+                    raise NotFound()
+                found = disk.set(key, data, format)
+
+    path, digest = found
+    response = send_file(path, mimetype=FORMATS[format][1], etag=digest,
+                         max_age=config['IMAGE_PROXY_MAX_AGE'],
+                         conditional=True)
+    response.cache_control.public = True
+    response.vary.add('Accept')
+    return response
+
+#----------------------------------------------------------------------------#
+# Flask integration.
+#----------------------------------------------------------------------------#
+
+
+def init_app(app):
+    app.config.setdefault('IMAGE_CACHE_DIR',
+                          os.path.join(app.instance_path, 'images'))
+    app.config.setdefault('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+    app.config.setdefault('IMAGE_PROXY_WIDTHS', [360, 560, 720, 1120])
+    app.config.setdefault('IMAGE_PROXY_MAX_BYTES', 10 * 1024 * 1024)
+    app.config.setdefault('IMAGE_PROXY_TIMEOUT', 5)
+    app.config.setdefault('IMAGE_PROXY_MAX_AGE', 30 * 24 * 3600)
+    app.config.setdefault('IMAGE_PROXY_ALLOW_PRIVATE', False)
+    app.extensions['images'] = DiskCache(app.config['IMAGE_CACHE_DIR'],
+                                         app.config['IMAGE_CACHE_MAX_BYTES'])
+    app.register_blueprint(images)
+    app.jinja_env.globals['thumbnail_url'] = thumbnail_url
@@ -0,0 +1,254 @@
+import csv
+import json
+import os
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.datastructures import MultiDict
+from models import db, Venue, Artist, Show
+from forms import VenueForm, ArtistForm, ShowForm
+import page_cache
+
+#----------------------------------------------------------------------------#
+# Readers.
+#----------------------------------------------------------------------------#
+
+
+class UnreadableRow(ValueError):
+    # yielded in place of a line that does not parse; rejected on import
+    pass
+
+
+def read_rows(path, fmt=None):
+    # Yields (line_number, dict) without loading the whole file, or
+    # (line_number, UnreadableRow) for a line that is not a JSON object.
+    if fmt is None:
+        fmt = 'jsonl' if path.endswith(('.jsonl', '.json')) else 'csv'
+    with open(path, newline='') as f:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(f), start=2):
+                yield number, row
+        else:
+            for number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield number, UnreadableRow('invalid JSON: %s' % e)
+                    continue
+                if not isinstance(row, dict):
+                    yield number, UnreadableRow('not a JSON object')
+                    continue
+                yield number, row
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+#----------------------------------------------------------------------------#
+# Validation.
+#----------------------------------------------------------------------------#
+
+ENTITIES = {
+    'venues': (Venue, VenueForm),
+    'artists': (Artist, ArtistForm),
+    'shows': (Show, ShowForm),
+}
+
+
+def _formdata(row):
+    data = MultiDict()
+    for key, value in row.items():
+        if value is None:
+            continue
+        if key == 'genres':
+            if isinstance(value, str):
+                value = [g.strip() for g in value.split(',') if g.strip()]
+            for genre in value:
+                data.add(key, genre)
+        elif isinstance(value, bool):
+            # BooleanField treats any non-false value as checked
+            data.add(key, 'y' if value else 'false')
+        else:
+            data.add(key, str(value))
+    return data
+
+
+def validate(form_class, row):
+    # The same rules as the web forms. Blank fields that are not required
+    # are dropped rather than rejected, since the forms' URL validators
+    # would otherwise refuse every row without a website.
+    formdata = _formdata(row)
+    form = form_class(formdata=formdata, meta={'csrf': False})
+    form.validate()
+    errors = {}
+    values = {}
+    for field in form:
+        blank = not formdata.get(field.name, '').strip()
+        if field.errors and not (blank and not field.flags.required):
+            errors[field.name] = field.errors
+        elif not blank or field.type == 'BooleanField':
+            values[field.name] = field.data
+    return values, errors
+
+#----------------------------------------------------------------------------#
+# Loading.
+#----------------------------------------------------------------------------#
+
+
+def _existing_ids(model, ids):
+    if not ids:
+        return set()
+    return set(i for (i,) in db.session.query(model.id).filter(
+        model.id.in_(ids)))
+
+
+def coerce_show_keys(rows):
+    # ShowForm keeps the ids as strings
+    coerced = []
+    rejected = []
+    for number, row in rows:
+        try:
+            row['venue_id'] = int(row['venue_id'])
+            row['artist_id'] = int(row['artist_id'])
+        except (KeyError, ValueError):
+            rejected.append((number, {'ids': ['venue_id and artist_id must '
+                                              'be integers']}))
+            continue
+        coerced.append((number, row))
+    return coerced, rejected
+
+
+def resolve_show_keys(rows):
+    # One IN query per referenced table for the whole chunk.
+    venues = _existing_ids(Venue, set(r['venue_id'] for _, r in rows))
+    artists = _existing_ids(Artist, set(r['artist_id'] for _, r in rows))
+    resolved = []
+    rejected = []
+    for number, row in rows:
+        if row['venue_id'] not in venues:
+            rejected.append((number, {'venue_id': ['unknown venue']}))
+        elif row['artist_id'] not in artists:
+            rejected.append((number, {'artist_id': ['unknown artist']}))
+        else:
+            resolved.append((number, row))
+    return resolved, rejected
+
+
+def uniform_rows(table, rows):
+    # validate() leaves out blank optional fields, but executemany takes its
+    # columns from the first row, so every row is given each column any row
+    # of the chunk has, missing ones set to the column's default or None.
+    names = set()
+    for _, row in rows:
+        names.update(row)
+    defaults = {}
+    for column in table.columns:
+        if column.name in names:
+            default = column.default
+            scalar = default is not None and default.is_scalar
+            defaults[column.name] = default.arg if scalar else None
+    return [(number, dict(defaults, **row)) for number, row in rows]
+
+
+def load_chunk(table, rows):
+    # executemany for the whole chunk; if the database refuses it, retry row
+    # by row in savepoints so one bad row only rejects itself.
+    rows = uniform_rows(table, rows)
+    try:
+        db.session.execute(table.insert(), [row for _, row in rows])
+        db.session.commit()
+        return len(rows), []
+    except SQLAlchemyError:
+        db.session.rollback()
+    loaded = 0
+    rejected = []
+    for number, row in rows:
+        savepoint = db.session.begin_nested()
+        try:
+            db.session.execute(table.insert(), [row])
+            savepoint.commit()
+            loaded += 1
+        except SQLAlchemyError as e:
+            savepoint.rollback()
+            rejected.append((number, {'database': [
+                str(getattr(e, 'orig', None) or e)]}))
+    db.session.commit()
+    return loaded, rejected
+
+
+def import_rows(entity, rows, chunk_size=1000, report=None):
+    model, form_class = ENTITIES[entity]
+    table = model.__table__
+    stats = {'read': 0, 'loaded': 0, 'rejected': []}
+    start = time.perf_counter()
+    for chunk in chunked(rows, chunk_size):
+        valid = []
+        for number, row in chunk:
+            if isinstance(row, UnreadableRow):
+                stats['rejected'].append((number, {'json': [str(row)]}))
+                continue
+            values, errors = validate(form_class, row)
+            if errors:
+                stats['rejected'].append((number, errors))
+            else:
+                valid.append((number, values))
+        if entity == 'shows':
+            valid, malformed = coerce_show_keys(valid)
+            valid, missing = resolve_show_keys(valid)
+            stats['rejected'].extend(malformed + missing)
+        if valid:
+            loaded, rejected = load_chunk(table, valid)
+            stats['loaded'] += loaded
+            stats['rejected'].extend(rejected)
+        stats['read'] += len(chunk)
+        stats['elapsed'] = time.perf_counter() - start
+        if report is not None:
+            report(stats)
+    stats['elapsed'] = time.perf_counter() - start
+    return stats
+
+#----------------------------------------------------------------------------#
+# CLI.
+#----------------------------------------------------------------------------#
+
+
+def _report(stats):
+    rate = stats['read'] / stats['elapsed'] if stats['elapsed'] else 0
+    click.echo('%d read, %d loaded, %d rejected (%.0f rows/s)' % (
+        stats['read'], stats['loaded'], len(stats['rejected']), rate))
+
+
+@click.command('import')
+@click.argument('entity', type=click.Choice(sorted(ENTITIES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='Defaults to the file extension.')
+@click.option('--chunk-size', default=1000, show_default=True)
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False),
+              help='Write rejected rows here as JSONL.')
+@with_appcontext
+def import_command(entity, path, fmt, chunk_size, errors_path):
+    """Bulk load venues, artists or shows from a CSV or JSONL file."""
+    # the forms are validated outside of a request
+    with current_app.test_request_context():
+        stats = import_rows(entity, read_rows(path, fmt), chunk_size,
+                            report=_report)
+    page_cache.bump()
+    click.echo('done in %.1fs' % stats['elapsed'])
+    if errors_path and stats['rejected']:
+        with open(errors_path, 'w') as f:
+            for number, errors in stats['rejected']:
+                f.write(json.dumps({'line': number, 'errors': errors}) + '\n')
+        click.echo('rejected rows written to %s' % os.path.abspath(
+            errors_path))
@@ -0,0 +1,127 @@
+import heapq
+import json
+import re
+import threading
+import time
+from collections import Counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+#----------------------------------------------------------------------------#
+# Per-request SQL profile.
+#----------------------------------------------------------------------------#
+
+_WHITESPACE = re.compile(r'\s+')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def statement_shape(statement):
+    # Parameters are already placeholders; literals inlined into the SQL are
+    # folded too so "WHERE id = 3" and "WHERE id = 4" count as one shape.
+    return _LITERAL.sub('?', _WHITESPACE.sub(' ', statement)).strip()
+
+
+class RequestProfile(object):
+    def __init__(self, top=3):
+        self.top = top
+        self.count = 0
+        self.total = 0.0
+        self.slowest = []   # min-heap of (duration, statement)
+        self.shapes = Counter()
+        # fanout.py records from worker threads too
+        self._lock = threading.Lock()
+
+    def record(self, statement, duration):
+        with self._lock:
+            self._record(statement, duration)
+
+    def _record(self, statement, duration):
+        self.count += 1
+        self.total += duration
+        self.shapes[statement_shape(statement)] += 1
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, (duration, statement))
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (duration, statement))
+
+    def repeated(self, threshold):
+        return [(shape, n) for shape, n in self.shapes.most_common()
+                if n > threshold]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    context._fyyur_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    duration = time.perf_counter() - context._fyyur_query_start
+    if has_request_context():
+        profile = g.get('sql_profile')
+        if profile is not None:
+            profile.record(statement, duration)
+
+
+def watch_engine(engine):
+    if not event.contains(engine, 'before_cursor_execute',
+                          _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+#----------------------------------------------------------------------------#
+# Flask integration.
+#----------------------------------------------------------------------------#
+
+
+def init_app(app, db):
+    app.config.setdefault('SQL_PROFILING_ENABLED', True)
+    app.config.setdefault('SQL_NPLUSONE_THRESHOLD', 10)
+    app.config.setdefault('SQL_SLOW_QUERY_MS', 100)
+    app.config.setdefault('SQL_PROFILE_TOP', 3)
+    if not app.config['SQL_PROFILING_ENABLED']:
+        return
+
+    with app.app_context():
+        watch_engine(db.get_engine())
+
+    @app.before_request
+    def start_profile():
+        g.request_start = time.perf_counter()
+        g.sql_profile = RequestProfile(app.config['SQL_PROFILE_TOP'])
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+        elapsed = time.perf_counter() - g.pop('request_start')
+        response.headers.add(
+            'Server-Timing', 'db;dur=%.1f;desc="%d queries", app;dur=%.1f' % (
+                profile.total * 1000, profile.count, elapsed * 1000))
+
+        slow_ms = app.config['SQL_SLOW_QUERY_MS']
+        slowest = sorted(profile.slowest, reverse=True)
+        app.logger.info(json.dumps({
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 1),
+            'queries': profile.count,
+            'db_ms': round(profile.total * 1000, 1),
+            'slow_queries': [
+                {'ms': round(d * 1000, 1), 'sql': statement_shape(s)}
+                for d, s in slowest if d * 1000 >= slow_ms],
+        }))
+        threshold = app.config['SQL_NPLUSONE_THRESHOLD']
+        for shape, n in profile.repeated(threshold):
+            app.logger.warning(json.dumps({
+                'event': 'n_plus_one',
+                'endpoint': request.endpoint,
+                'path': request.path,
+                'repeats': n,
+                'sql': shape,
+            }))
+        return response
@@ -0,0 +1,122 @@
+import threading
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import DateTime, column, table, text
+from models import db
+import page_cache
+
+#----------------------------------------------------------------------------#
+# Views.
+#----------------------------------------------------------------------------#
+
+# Created by migration e7b4c2a9d1f3. They are not models: nothing writes to
+# them, and keeping them off db.metadata keeps create_all and autogenerate
+# from treating them as tables.
+venue_areas = table(
+    'venue_areas_mv',
+    column('state'), column('city'), column('venue_id'),
+    column('venue_name'), column('num_upcoming_shows'))
+
+show_listing = table(
+    'show_listing_mv',
+    column('show_id'), column('start_time', DateTime(timezone=True)),
+    column('venue_id'),
+    column('venue_name'), column('artist_id'), column('artist_name'),
+    column('artist_image_link'))
+
+VIEWS = [venue_areas.name, show_listing.name]
+
+
+def refresh(engine):
+    # CONCURRENTLY keeps the views readable while they rebuild; two refreshes
+    # of one view queue behind each other on its lock rather than overlap.
+    timings = {}
+    for name in VIEWS:
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            # a full rebuild can outlast the request statement timeout
+            conn.execute(text('SET LOCAL statement_timeout = 0'))
+            conn.execute(text(
+                'REFRESH MATERIALIZED VIEW CONCURRENTLY %s' % name))
+        timings[name] = time.perf_counter() - start
+    return timings
+
+#----------------------------------------------------------------------------#
+# Refresh after writes.
+#----------------------------------------------------------------------------#
+
+
+class Refresher(object):
+    # Writes within `delay` seconds of each other share one refresh, run on
+    # a background thread so no request waits for it.
+    def __init__(self, app, engine, delay):
+        self.app = app
+        self.engine = engine
+        self.delay = delay
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def request(self):
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self._run)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _run(self):
+        with self._lock:
+            self._timer = None
+        try:
+            timings = refresh(self.engine)
+        except Exception:
+            self.app.logger.exception('materialized view refresh failed')
+            return
+        # pages rendered between the write and now may hold the old rows;
+        # the timer thread has no app context of its own
+        with self.app.app_context():
+            page_cache.bump()
+        self.app.logger.info('refreshed %s' % ', '.join(
+            '%s in %.2fs' % item for item in timings.items()))
+
+
+def written():
+    # called by the write views once their commit has gone through; searches
+    # and failed submissions never get here
+    refresher = current_app.extensions.get('matviews')
+    if refresher is not None:
+        refresher.request()
+
+
+def init_app(app, db):
+    app.config.setdefault('MATERIALIZED_VIEWS_ENABLED', False)
+    app.config.setdefault('MATERIALIZED_VIEWS_REFRESH_ON_WRITE', True)
+    app.config.setdefault('MATERIALIZED_VIEWS_REFRESH_DELAY', 5)
+    if not (app.config['MATERIALIZED_VIEWS_ENABLED'] and
+            app.config['MATERIALIZED_VIEWS_REFRESH_ON_WRITE']):
+        return
+
+    with app.app_context():
+        engine = db.get_engine()
+    app.extensions['matviews'] = Refresher(
+        app, engine, app.config['MATERIALIZED_VIEWS_REFRESH_DELAY'])
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+
+@click.group('matviews')
+def matviews_command():
+    """Maintain the listing materialized views."""
+
+
+@matviews_command.command('refresh')
+@with_appcontext
+def refresh_command():
+    """Refresh the listing views; run it on a schedule."""
+    timings = refresh(db.get_engine())
+    page_cache.bump()
+    for name, elapsed in timings.items():
+        click.echo('%s refreshed in %.2fs' % (name, elapsed))
@@ -0,0 +1,225 @@
+import bisect
+import threading
+import time
+from flask import Response, g, request, template_rendered, \
+    before_render_template, signals_available
+
+#----------------------------------------------------------------------------#
+# Metric types.
+#----------------------------------------------------------------------------#
+
+# Counters live in this process only; with several workers each one exposes
+# its own /metrics and the scraper aggregates them (one target per worker).
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (
+        n, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for n, v in zip(names, values))
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.label_names = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, _labels(self.label_names, labels), value
+
+
+class Histogram(object):
+    kind = 'histogram'
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.label_names = labels
+        self.buckets = buckets
+        self._values = {}  # labels -> [per-bucket counts..., +Inf, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = [(labels, list(series))
+                      for labels, series in self._values.items()]
+        names = self.label_names + ('le',)
+        for labels, series in values:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), series):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield (self.name + '_bucket',
+                       _labels(names, labels + (le,)), cumulative)
+            yield self.name + '_count', _labels(self.label_names,
+                                                labels), cumulative
+            yield self.name + '_sum', _labels(self.label_names,
+                                              labels), series[-1]
+
+
+class Gauge(object):
+    # Read at scrape time from a callback returning {labels: value}; also
+    # used with kind='counter' for totals that are counted elsewhere.
+    def __init__(self, name, doc, collect, labels=(), kind='gauge'):
+        self.name = name
+        self.doc = doc
+        self.label_names = labels
+        self.collect = collect
+        self.kind = kind
+
+    def samples(self):
+        for labels, value in self.collect().items():
+            yield self.name, _labels(self.label_names, labels), value
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.doc))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append('%s%s %s' % (name, labels, repr(float(value))))
+        return '\n'.join(lines) + '\n'
+
+#----------------------------------------------------------------------------#
+# Flask integration.
+#----------------------------------------------------------------------------#
+
+
+class Metrics(object):
+    # One registry per app, so a second create_app() (tests, scripts) starts
+    # its own families rather than adding duplicates to the first one's.
+    def __init__(self):
+        self.registry = Registry()
+        self.requests_total = self.registry.register(Counter(
+            'fyyur_http_requests_total',
+            'HTTP requests by endpoint and status.',
+            ('endpoint', 'method', 'status')))
+        self.request_duration = self.registry.register(Histogram(
+            'fyyur_http_request_duration_seconds',
+            'Request latency by endpoint.', ('endpoint',)))
+        self.template_duration = self.registry.register(Histogram(
+            'fyyur_template_render_seconds', 'Jinja render time by template.',
+            ('template',)))
+
+
+def _pool_gauges(registry, engines):
+    # engines: [(label, engine)], the primary and any read replicas
+    def collect(method, adjust):
+        def read():
+            values = {}
+            for name, engine in engines:
+                pool = engine.pool
+                # NullPool and friends have no sizing to report
+                if hasattr(pool, method):
+                    values[(name,)] = adjust(getattr(pool, method)())
+            return values
+        return read
+
+    def same(value):
+        return value
+
+    def beyond(value):
+        # QueuePool.overflow() counts up from -pool_size
+        return max(value, 0)
+
+    for method, doc, adjust in (
+            ('size', 'Configured pool size.', same),
+            ('checkedout', 'Connections currently checked out.', same),
+            ('checkedin', 'Idle connections in the pool.', same),
+            ('overflow', 'Connections open beyond pool_size.', beyond)):
+        registry.register(Gauge('fyyur_db_pool_' + method, doc,
+                                collect(method, adjust), ('engine',)))
+
+
+def _cache_gauges(registry, cache, page_stats):
+    registry.register(Gauge(
+        'fyyur_cache_lookups_total', 'Detail payload cache lookups.',
+        lambda: {('hit',): cache.hits, ('miss',): cache.misses},
+        ('result',), kind='counter'))
+    registry.register(Gauge(
+        'fyyur_page_cache_lookups_total', 'Rendered page cache lookups.',
+        lambda: {('hit',): page_stats.hits, ('miss',): page_stats.misses,
+                 ('not_modified',): page_stats.not_modified},
+        ('result',), kind='counter'))
+
+
+def init_app(app, db, cache=None, page_stats=None):
+    app_metrics = app.extensions['metrics'] = Metrics()
+    with app.app_context():
+        engines = [('primary', db.get_engine())]
+    replicas = app.extensions.get('fyyur_replicas')
+    if replicas is not None:
+        engines.extend(
+            (replica.engine.url.render_as_string(hide_password=True),
+             replica.engine) for replica in replicas.replicas)
+    _pool_gauges(app_metrics.registry, engines)
+    if cache is not None:
+        _cache_gauges(app_metrics.registry, cache, page_stats)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            # unmatched URLs share one label to keep cardinality bounded
+            endpoint = request.endpoint or 'unmatched'
+            app_metrics.request_duration.observe(
+                time.perf_counter() - start, endpoint)
+            app_metrics.requests_total.inc(endpoint, request.method,
+                                           response.status_code)
+        return response
+
+    def start_render(sender, template, context, **extra):
+        g.setdefault('render_starts', []).append(time.perf_counter())
+
+    def finish_render(sender, template, context, **extra):
+        starts = g.get('render_starts')
+        if starts:
+            app_metrics.template_duration.observe(
+                time.perf_counter() - starts.pop(), template.name)
+
+    # template timing needs blinker, which flask treats as optional
+    if signals_available:
+        before_render_template.connect(start_render, app, weak=False)
+        template_rendered.connect(finish_render, app, weak=False)
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(app_metrics.registry.render(),
+                        mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,43 @@
+"""convert shows.start_time to timestamptz and index it
+
+Revision ID: 3c9a1f2d7e4b
+Revises: aeec9311ee3c
+Create Date: 2020-06-02 18:21:07.512936
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9a1f2d7e4b'
+down_revision = 'aeec9311ee3c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing strings are ISO-like ('2020-05-13 11:00:00',
+    # '2019-05-21T21:30:00.000Z'), which postgres casts directly
+    op.alter_column('shows', 'start_time',
+               existing_type=sa.String(),
+               type_=sa.DateTime(timezone=True),
+               existing_nullable=False,
+               postgresql_using='start_time::timestamp with time zone')
+    op.create_index('ix_shows_venue_id_start_time', 'shows',
+                    ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_artist_id_start_time', 'shows',
+                    ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_start_time_id', 'shows',
+                    ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_shows_start_time_id', table_name='shows')
+    op.drop_index('ix_shows_artist_id_start_time', table_name='shows')
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
+    op.alter_column('shows', 'start_time',
+               existing_type=sa.DateTime(timezone=True),
+               type_=sa.String(),
+               existing_nullable=False,
+               postgresql_using="to_char(start_time, 'YYYY-MM-DD HH24:MI:SS')")
@@ -0,0 +1,63 @@
+"""add trigram and full-text search indexes for venues and artists
+
+Revision ID: 8f41d2b6c0a9
+Revises: 3c9a1f2d7e4b
+Create Date: 2020-06-04 10:02:45.118304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8f41d2b6c0a9'
+down_revision = '3c9a1f2d7e4b'
+branch_labels = None
+depends_on = None
+
+# venues and artists share name/city/state/genres, so one trigger function
+# keeps both search vectors current
+SEARCH_VECTOR = """
+    setweight(to_tsvector('simple', coalesce({row}name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce({row}city, '') || ' ' ||
+                                    coalesce({row}state, '')), 'B') ||
+    setweight(to_tsvector('simple',
+                          coalesce(array_to_string({row}genres, ' '), '')), 'C')
+"""
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute("""
+        CREATE FUNCTION catalog_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """.format(SEARCH_VECTOR.format(row='NEW.')))
+    for table in ('venues', 'artists'):
+        op.add_column(table, sa.Column('search_vector', postgresql.TSVECTOR(),
+                                       nullable=True))
+        op.execute('UPDATE {} SET search_vector = {}'.format(
+            table, SEARCH_VECTOR.format(row='')))
+        op.execute("""
+            CREATE TRIGGER {0}_search_vector_update
+            BEFORE INSERT OR UPDATE OF name, city, state, genres ON {0}
+            FOR EACH ROW EXECUTE PROCEDURE catalog_search_vector_update()
+        """.format(table))
+        op.create_index('ix_{}_search_vector'.format(table), table,
+                        ['search_vector'], postgresql_using='gin')
+        op.create_index('ix_{}_name_trgm'.format(table), table, ['name'],
+                        postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        op.drop_index('ix_{}_name_trgm'.format(table), table_name=table)
+        op.drop_index('ix_{}_search_vector'.format(table), table_name=table)
+        op.execute('DROP TRIGGER {0}_search_vector_update ON {0}'.format(table))
+        op.drop_column(table, 'search_vector')
+    op.execute('DROP FUNCTION catalog_search_vector_update()')
@@ -0,0 +1,32 @@
+"""add updated_at watermarks for incremental exports
+
+Revision ID: c2d7e9a14b3f
+Revises: 8f41d2b6c0a9
+Create Date: 2020-06-09 14:37:12.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2d7e9a14b3f'
+down_revision = '8f41d2b6c0a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists', 'shows'):
+        op.add_column(table, sa.Column('updated_at',
+                                       sa.DateTime(timezone=True),
+                                       server_default=sa.text('now()'),
+                                       nullable=False))
+        op.create_index('ix_{}_updated_at'.format(table), table,
+                        ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('shows', 'artists', 'venues'):
+        op.drop_index('ix_{}_updated_at'.format(table), table_name=table)
+        op.drop_column(table, 'updated_at')
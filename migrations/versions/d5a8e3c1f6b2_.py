@@ -0,0 +1,110 @@
+"""trigger-maintained past/upcoming show counters on venues and artists
+
+Revision ID: d5a8e3c1f6b2
+Revises: c2d7e9a14b3f
+Create Date: 2020-06-11 09:21:40.615028
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a8e3c1f6b2'
+down_revision = 'c2d7e9a14b3f'
+branch_labels = None
+depends_on = None
+
+# A show counts as upcoming while its start_time is after the watermark in
+# show_counter_watermark; `flask counters roll` advances the watermark and
+# moves the shows it passes from upcoming to past. The trigger takes a share
+# lock on the watermark row so a roll never races an insert or delete.
+APPLY_FUNCTION = """
+    CREATE FUNCTION show_counters_apply(
+        p_venue_id integer, p_artist_id integer, p_start_time timestamptz,
+        delta integer) RETURNS void AS $$
+    DECLARE
+        watermark timestamptz;
+    BEGIN
+        SELECT rolled_at INTO watermark FROM show_counter_watermark FOR SHARE;
+        IF p_start_time > watermark THEN
+            UPDATE venues SET upcoming_shows_count = upcoming_shows_count + delta
+                WHERE id = p_venue_id;
+            UPDATE artists SET upcoming_shows_count = upcoming_shows_count + delta
+                WHERE id = p_artist_id;
+        ELSE
+            UPDATE venues SET past_shows_count = past_shows_count + delta
+                WHERE id = p_venue_id;
+            UPDATE artists SET past_shows_count = past_shows_count + delta
+                WHERE id = p_artist_id;
+        END IF;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+TRIGGER_FUNCTION = """
+    CREATE FUNCTION show_counters_update() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            PERFORM show_counters_apply(OLD.venue_id, OLD.artist_id,
+                                        OLD.start_time, -1);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM show_counters_apply(NEW.venue_id, NEW.artist_id,
+                                        NEW.start_time, 1);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+# the new columns default to 0, so only venues/artists with shows need a row
+BACKFILL = """
+    UPDATE {table} t SET
+        upcoming_shows_count = s.upcoming,
+        past_shows_count = s.past
+    FROM (
+        SELECT {fk},
+               count(*) FILTER (WHERE start_time > w.rolled_at) AS upcoming,
+               count(*) FILTER (WHERE start_time <= w.rolled_at) AS past
+        FROM shows, show_counter_watermark w
+        GROUP BY {fk}
+    ) s
+    WHERE s.{fk} = t.id
+"""
+
+
+def upgrade():
+    op.create_table('show_counter_watermark',
+                    sa.Column('id', sa.Boolean(), server_default=sa.true(),
+                              nullable=False),
+                    sa.Column('rolled_at', sa.DateTime(timezone=True),
+                              nullable=False),
+                    sa.CheckConstraint('id',
+                                       name='show_counter_watermark_single_row'),
+                    sa.PrimaryKeyConstraint('id'))
+    op.execute('INSERT INTO show_counter_watermark (rolled_at) VALUES (now())')
+    for table, fk in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        for column in ('upcoming_shows_count', 'past_shows_count'):
+            op.add_column(table, sa.Column(column, sa.Integer(),
+                                           server_default='0',
+                                           nullable=False))
+        op.execute(BACKFILL.format(table=table, fk=fk))
+    op.execute(APPLY_FUNCTION)
+    op.execute(TRIGGER_FUNCTION)
+    op.execute("""
+        CREATE TRIGGER show_counters_update
+        AFTER INSERT OR DELETE OR UPDATE OF venue_id, artist_id, start_time
+        ON shows FOR EACH ROW EXECUTE PROCEDURE show_counters_update()
+    """)
+
+
+def downgrade():
+    op.execute('DROP TRIGGER show_counters_update ON shows')
+    op.execute('DROP FUNCTION show_counters_update()')
+    op.execute('DROP FUNCTION show_counters_apply(integer, integer, '
+               'timestamptz, integer)')
+    for table in ('artists', 'venues'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
+    op.drop_table('show_counter_watermark')
@@ -0,0 +1,48 @@
+"""materialized views for the venue areas and shows listings
+
+Revision ID: e7b4c2a9d1f3
+Revises: d5a8e3c1f6b2
+Create Date: 2020-06-13 16:48:05.270391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b4c2a9d1f3'
+down_revision = 'd5a8e3c1f6b2'
+branch_labels = None
+depends_on = None
+
+# Each view has a unique index, which REFRESH ... CONCURRENTLY requires, and
+# that index is also in the order the page reads, so a page is one index scan.
+
+
+def upgrade():
+    op.execute("""
+        CREATE MATERIALIZED VIEW venue_areas_mv AS
+        SELECT state, city, id AS venue_id, name AS venue_name,
+               upcoming_shows_count AS num_upcoming_shows
+        FROM venues
+    """)
+    op.create_index('ix_venue_areas_mv_area', 'venue_areas_mv',
+                    ['state', 'city', 'venue_name', 'venue_id'], unique=True)
+    op.execute("""
+        CREATE MATERIALIZED VIEW show_listing_mv AS
+        SELECT s.id AS show_id, s.start_time,
+               s.venue_id, v.name AS venue_name,
+               s.artist_id, a.name AS artist_name,
+               a.image_link AS artist_image_link
+        FROM shows s
+        JOIN venues v ON v.id = s.venue_id
+        JOIN artists a ON a.id = s.artist_id
+    """)
+    op.create_index('ix_show_listing_mv_start_time_show_id',
+                    'show_listing_mv', ['start_time', 'show_id'],
+                    unique=True)
+
+
+def downgrade():
+    op.execute('DROP MATERIALIZED VIEW show_listing_mv')
+    op.execute('DROP MATERIALIZED VIEW venue_areas_mv')
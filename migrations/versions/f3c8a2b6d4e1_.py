@@ -0,0 +1,49 @@
+"""bump updated_at when the show counters change
+
+Revision ID: f3c8a2b6d4e1
+Revises: e7b4c2a9d1f3
+Create Date: 2020-06-15 10:12:48.337910
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8a2b6d4e1'
+down_revision = 'e7b4c2a9d1f3'
+branch_labels = None
+depends_on = None
+
+# The counters are exported with the rest of the row, so a venue or artist
+# whose counts moved has to show up in the next `flask export --since`.
+APPLY_FUNCTION = """
+    CREATE OR REPLACE FUNCTION show_counters_apply(
+        p_venue_id integer, p_artist_id integer, p_start_time timestamptz,
+        delta integer) RETURNS void AS $$
+    DECLARE
+        watermark timestamptz;
+    BEGIN
+        SELECT rolled_at INTO watermark FROM show_counter_watermark FOR SHARE;
+        IF p_start_time > watermark THEN
+            UPDATE venues SET upcoming_shows_count = upcoming_shows_count + delta{updated_at}
+                WHERE id = p_venue_id;
+            UPDATE artists SET upcoming_shows_count = upcoming_shows_count + delta{updated_at}
+                WHERE id = p_artist_id;
+        ELSE
+            UPDATE venues SET past_shows_count = past_shows_count + delta{updated_at}
+                WHERE id = p_venue_id;
+            UPDATE artists SET past_shows_count = past_shows_count + delta{updated_at}
+                WHERE id = p_artist_id;
+        END IF;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+
+def upgrade():
+    op.execute(APPLY_FUNCTION.format(updated_at=',\n                updated_at = now()'))
+
+
+def downgrade():
+    op.execute(APPLY_FUNCTION.format(updated_at=''))
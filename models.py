@@ -1,21 +1,8 @@
-import json
-import dateutil.parser
-import babel
-from flask import (
-    Flask,
-    render_template,
-    request,
-    Response,
-    flash,
-    redirect,
-    url_for)
-from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
-
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from routing import RoutingSQLAlchemy
+
+# Bound to the application by create_app() in app.py.
+db = RoutingSQLAlchemy()
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
@@ -23,6 +10,12 @@ db = SQLAlchemy(app)
 
 class Venue(db.Model):
     __tablename__ = 'venues'
+    __table_args__ = (
+        db.Index('ix_venues_search_vector', 'search_vector',
+                 postgresql_using='gin'),
+        db.Index('ix_venues_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -36,7 +29,18 @@ class Venue(db.Model):
     facebook_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, default=True, nullable=False)
     seeking_description = db.Column(db.String())
-    shows = db.relationship('Show', backref='venues', lazy='dynamic')
+    # maintained by the catalog_search_vector_update trigger
+    search_vector = db.deferred(db.Column(TSVECTOR))
+    # maintained by the show_counters_update trigger, see counters.py
+    upcoming_shows_count = db.Column(db.Integer, server_default='0',
+                                     nullable=False)
+    past_shows_count = db.Column(db.Integer, server_default='0',
+                                 nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), index=True,
+                           server_default=db.func.now(),
+                           onupdate=db.func.now(), nullable=False)
+    shows = db.relationship('Show', backref='venues', lazy='select',
+                            order_by='Show.start_time')
 
     def get_json(self):
         return{
@@ -62,6 +66,12 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'artists'
+    __table_args__ = (
+        db.Index('ix_artists_search_vector', 'search_vector',
+                 postgresql_using='gin'),
+        db.Index('ix_artists_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -74,7 +84,16 @@ class Artist(db.Model):
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=True, nullable=False)
     seeking_description = db.Column(db.String())
-    shows = db.relationship('Show', backref='artists', lazy='dynamic')
+    search_vector = db.deferred(db.Column(TSVECTOR))
+    upcoming_shows_count = db.Column(db.Integer, server_default='0',
+                                     nullable=False)
+    past_shows_count = db.Column(db.Integer, server_default='0',
+                                 nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), index=True,
+                           server_default=db.func.now(),
+                           onupdate=db.func.now(), nullable=False)
+    shows = db.relationship('Show', backref='artists', lazy='select',
+                            order_by='Show.start_time')
 
     def __init__(self, name, genres, city, state, phone, image_link, website, facebook_link,
                  seeking_venue=False, seeking_description=""):
@@ -115,5 +134,19 @@ class Show(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey(Venue.id), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey(Artist.id), nullable=False)
-    start_time = db.Column(db.String, nullable=False)
+    start_time = db.Column(db.DateTime(timezone=True), nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), index=True,
+                           server_default=db.func.now(),
+                           onupdate=db.func.now(), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+    )
 # DONE Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+
+
+# the Show.venues/Show.artists backrefs only exist once the mappers are
+# configured; do it now so statements can be built before the first query
+db.configure_mappers()
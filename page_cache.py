@@ -0,0 +1,140 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, make_response, request, session
+from cache import cache, MemoryBackend, NullBackend
+import filters
+
+#----------------------------------------------------------------------------#
+# Data version.
+#----------------------------------------------------------------------------#
+
+# Every write view bumps the version; cached pages and ETags carry the version
+# they were rendered at, so a bump invalidates all of them at once. The
+# modification time is part of the version too, so a counter that restarts
+# from zero (new worker, evicted key) never reproduces an old ETag. It is kept
+# in whole seconds and every bump moves it at least one second forward, so
+# Last-Modified changes with it and If-Modified-Since cannot match a page
+# rendered earlier in the same second.
+#
+# The redis backend shares the version between workers and the flask
+# commands. With the memory backend it is private to each worker, which never
+# hears of writes made elsewhere, so there it expires after
+# PAGE_CACHE_TIMEOUT: the next request starts a new version and other workers
+# stop answering 304 for old pages within that time.
+VERSION_KEY = 'data-version'
+MODIFIED_KEY = 'data-modified'
+
+
+def _version_timeout():
+    if isinstance(cache.backend, MemoryBackend):
+        return current_app.config.get('PAGE_CACHE_TIMEOUT', 60)
+    return 0
+
+
+def data_version():
+    # (counter, modified timestamp)
+    counter = cache.backend.incr(VERSION_KEY, 0)
+    modified = cache.backend.get(MODIFIED_KEY)
+    if not isinstance(modified, int):
+        modified = int(time.time())
+        cache.backend.set(MODIFIED_KEY, modified, _version_timeout())
+    return counter, modified
+
+
+def bump():
+    previous = cache.backend.get(MODIFIED_KEY)
+    modified = int(time.time()) + 1
+    if isinstance(previous, int):
+        modified = max(modified, previous + 1)
+    cache.backend.set(MODIFIED_KEY, modified, _version_timeout())
+    return cache.backend.incr(VERSION_KEY)
+
+#----------------------------------------------------------------------------#
+# Output cache.
+#----------------------------------------------------------------------------#
+
+
+class PageStats(object):
+    # per app, see init_app()
+    hits = 0
+    misses = 0
+    not_modified = 0
+
+
+def current_stats():
+    return current_app.extensions['page_cache']
+
+
+def _enabled():
+    return current_app.config.get('PAGE_CACHE_ENABLED', True) and \
+        not isinstance(cache.backend, NullBackend)
+
+
+def _page_key():
+    # dates render in the request's locale and timezone, so each combination
+    # is its own page
+    args = sorted(request.args.items(multi=True))
+    return 'page:%s:%s:%s?%s' % (
+        filters.request_locale(), filters.request_timezone(), request.path,
+        '&'.join('%s=%s' % (k, v) for k, v in args))
+
+
+def _conditional(response, etag, modified):
+    response.set_etag(etag)
+    response.last_modified = modified
+    # clients may keep the page but must revalidate, which is a cheap 304
+    response.headers['Cache-Control'] = 'no-cache'
+    # the page is rendered in the request's locale and timezone cookie
+    response.vary.add('Accept-Language')
+    response.vary.add('Cookie')
+    return response
+
+
+def cached_page(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # pages carrying flashed messages are personal, never cache them
+        if request.method != 'GET' or not _enabled() or '_flashes' in session:
+            return view(*args, **kwargs)
+
+        stats = current_stats()
+        key = _page_key()
+        version = data_version()
+        modified = datetime.fromtimestamp(version[1], timezone.utc)
+        etag = hashlib.sha1(
+            ('%s:%d:%r' % (key, version[0], version[1])).encode('utf-8')
+        ).hexdigest()
+
+        if request.if_none_match:
+            fresh = request.if_none_match.contains(etag)
+        else:
+            fresh = request.if_modified_since is not None and \
+                request.if_modified_since >= modified
+        if fresh:
+            stats.not_modified += 1
+            return _conditional(make_response('', 304), etag, modified)
+
+        entry = cache.backend.get(key)
+        if isinstance(entry, tuple) and entry[0] == version:
+            stats.hits += 1
+            response = make_response(entry[1])
+            response.mimetype = 'text/html'
+        else:
+            stats.misses += 1
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                cache.backend.set(
+                    key, (version, response.get_data()),
+                    current_app.config.get('PAGE_CACHE_TIMEOUT', 60))
+        return _conditional(response, etag, modified)
+    return wrapper
+
+#----------------------------------------------------------------------------#
+# Flask integration.
+#----------------------------------------------------------------------------#
+
+
+def init_app(app):
+    app.extensions['page_cache'] = PageStats()
@@ -0,0 +1,75 @@
+import click
+from sqlalchemy import event
+
+#----------------------------------------------------------------------------#
+# Effective pool settings.
+#----------------------------------------------------------------------------#
+
+
+def pool_settings(app, engine):
+    config = app.config
+    pool = engine.pool
+    settings = {
+        'env': config['FYYUR_ENV'],
+        'pool': type(pool).__name__,
+        'pgbouncer': config['PGBOUNCER'],
+        'statement_timeout_ms': config['DB_STATEMENT_TIMEOUT_MS'],
+        'workers': config['WEB_CONCURRENCY'],
+    }
+    if hasattr(pool, 'size'):
+        settings.update({
+            'pool_size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'pool_timeout': pool._timeout,
+            'pool_recycle': pool._recycle,
+            'pool_pre_ping': pool._pre_ping,
+        })
+        settings['per_worker'] = pool.size() + pool._max_overflow
+        settings['total'] = settings['per_worker'] * settings['workers']
+    return settings
+
+
+def describe(settings):
+    if 'pool_size' not in settings:
+        return ('db pool [%(env)s]: %(pool)s, one connection per checkout, '
+                'pgbouncer=%(pgbouncer)s, statement_timeout=%(statement_'
+                'timeout_ms)dms' % settings)
+    return ('db pool [%(env)s]: %(pool)s size=%(pool_size)d '
+            'overflow=%(max_overflow)d timeout=%(pool_timeout)ss '
+            'recycle=%(pool_recycle)ss pre_ping=%(pool_pre_ping)s '
+            'statement_timeout=%(statement_timeout_ms)dms; up to '
+            '%(per_worker)d connections per worker, %(total)d across '
+            '%(workers)d workers' % settings)
+
+#----------------------------------------------------------------------------#
+# PgBouncer.
+#----------------------------------------------------------------------------#
+
+
+def _statement_timeout_hook(timeout_ms):
+    # SET LOCAL lasts only until the transaction ends, so it never leaks to
+    # the next client PgBouncer hands this server connection to.
+    def begin(conn):
+        cursor = conn.connection.cursor()
+        cursor.execute('SET LOCAL statement_timeout = %d' % timeout_ms)
+        cursor.close()
+    return begin
+
+#----------------------------------------------------------------------------#
+# Flask integration.
+#----------------------------------------------------------------------------#
+
+
+def init_app(app, db):
+    with app.app_context():
+        engine = db.get_engine()
+    timeout_ms = app.config['DB_STATEMENT_TIMEOUT_MS']
+    if app.config['PGBOUNCER'] and timeout_ms:
+        event.listen(engine, 'begin', _statement_timeout_hook(timeout_ms))
+
+    app.logger.info(describe(pool_settings(app, engine)))
+
+    @app.cli.command('pool-report')
+    def pool_report():
+        """Print the effective database pool settings."""
+        click.echo(describe(pool_settings(app, engine)))
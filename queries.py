@@ -0,0 +1,335 @@
+import base64
+import json
+from datetime import datetime, timezone
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import joinedload
+from models import db, Show, Venue, Artist
+from cache import cache
+import matviews
+import fanout
+from routing import REPLICA_KEY
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+
+def current_time():
+    return datetime.now(timezone.utc)
+
+
+def encode_cursor(start_time, show_id):
+    raw = json.dumps([start_time.isoformat(), show_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    # Returns None for anything that is not a cursor we produced.
+    try:
+        start_time, show_id = json.loads(base64.urlsafe_b64decode(
+            cursor.encode('ascii')).decode('utf-8'))
+        return datetime.fromisoformat(start_time), int(show_id)
+    except (ValueError, TypeError):
+        return None
+
+#----------------------------------------------------------------------------#
+# Venue directory.
+#----------------------------------------------------------------------------#
+
+
+# Each read is split into a statement builder and a function that shapes the
+# rows, so the async serving mode (asgi.py) runs the same SQL on its own
+# session.
+
+
+def venue_areas_statement(from_view=False):
+    # Upcoming counts come from the trigger-maintained column, so this is a
+    # plain ordered scan of venues. from_view reads venue_areas_mv instead,
+    # whose unique index is already in this order.
+    if from_view:
+        mv = matviews.venue_areas
+        return select(
+            mv.c.city, mv.c.state, mv.c.venue_id, mv.c.venue_name,
+            mv.c.num_upcoming_shows
+        ).order_by(mv.c.state, mv.c.city, mv.c.venue_name, mv.c.venue_id)
+    return select(
+        Venue.city, Venue.state, Venue.id, Venue.name,
+        Venue.upcoming_shows_count
+    ).order_by(Venue.state, Venue.city, Venue.name)
+
+
+def group_areas(rows):
+    # venues of the same city/state are adjacent, so one pass groups them
+    areas = []
+    area = None
+    for city, state, vid, vname, upcoming in rows:
+        if area is None or area['city'] != city or area['state'] != state:
+            area = {'city': city, 'state': state, 'venues': []}
+            areas.append(area)
+        area['venues'].append({
+            'id': vid,
+            'name': vname,
+            'num_upcoming_shows': upcoming,
+        })
+    return areas
+
+
+def venue_areas(from_view=False):
+    return group_areas(db.session.execute(venue_areas_statement(from_view)))
+
+#----------------------------------------------------------------------------#
+# Detail pages.
+#----------------------------------------------------------------------------#
+
+
+def _split_shows(shows, now, tile):
+    upcoming = []
+    past = []
+    for show in shows:
+        if show.start_time > now:
+            upcoming.append(tile(show))
+        else:
+            past.append(tile(show))
+    return upcoming, past
+
+
+def venue_details_statement(venue_id):
+    # The venue, its shows and each show's artist come back in one joined
+    # query; only the artist columns the page renders are loaded.
+    return select(Venue).options(
+        joinedload(Venue.shows).load_only(Show.artist_id, Show.start_time)
+        .joinedload(Show.artists).load_only(Artist.name, Artist.image_link)
+    ).where(Venue.id == venue_id)
+
+
+def venue_details_from(venue, now=None):
+    if venue is None:
+        return None
+    now = now or current_time()
+    details = venue.get_json()
+    upcoming, past = _split_shows(venue.shows, now, lambda show: {
+        'artist_id': show.artist_id,
+        'artist_name': show.artists.name,
+        'artist_image_link': show.artists.image_link,
+        'start_time': show.start_time,
+    })
+    details['upcoming_shows'] = upcoming
+    details['past_shows'] = past
+    details['upcoming_shows_count'] = len(upcoming)
+    details['past_shows_count'] = len(past)
+    return details
+
+
+def venue_details(venue_id, now=None):
+    venue = db.session.execute(
+        venue_details_statement(venue_id)).unique().scalars().first()
+    return venue_details_from(venue, now)
+
+
+def artist_details_statement(artist_id):
+    return select(Artist).options(
+        joinedload(Artist.shows).load_only(Show.venue_id, Show.start_time)
+        .joinedload(Show.venues).load_only(Venue.name, Venue.image_link)
+    ).where(Artist.id == artist_id)
+
+
+def artist_details_from(artist, now=None):
+    if artist is None:
+        return None
+    now = now or current_time()
+    details = artist.info()
+    upcoming, past = _split_shows(artist.shows, now, lambda show: {
+        'venue_id': show.venue_id,
+        'venue_name': show.venues.name,
+        'venue_image_link': show.venues.image_link,
+        'start_time': show.start_time,
+    })
+    details['upcoming_shows'] = upcoming
+    details['past_shows'] = past
+    details['upcoming_shows_count'] = len(upcoming)
+    details['past_shows_count'] = len(past)
+    return details
+
+
+def artist_details(artist_id, now=None):
+    artist = db.session.execute(
+        artist_details_statement(artist_id)).unique().scalars().first()
+    return artist_details_from(artist, now)
+
+
+def _shows_statements(fk, entity_id, other, other_fk, now):
+    # upcoming and past as two independent statements, each an index range
+    # scan on (fk, start_time)
+    statement = select(
+        other.id, other.name, other.image_link, Show.start_time
+    ).join(other, other.id == other_fk).where(fk == entity_id)
+    return (statement.where(Show.start_time > now).order_by(Show.start_time),
+            statement.where(Show.start_time <= now).order_by(Show.start_time))
+
+
+def _parallel_details(model, entity_id, serialize, fk, other, other_fk, prefix,
+                      engine, now):
+    # The entity, its upcoming shows and its past shows are fetched at the
+    # same time on separate connections instead of as one wide join.
+    now = now or current_time()
+    upcoming_statement, past_statement = _shows_statements(
+        fk, entity_id, other, other_fk, now)
+
+    def entity(session):
+        row = session.get(model, entity_id)
+        return None if row is None else serialize(row)
+
+    details, upcoming, past = fanout.run(engine, [
+        entity,
+        lambda session: session.execute(upcoming_statement).all(),
+        lambda session: session.execute(past_statement).all(),
+    ])
+    if details is None:
+        return None
+
+    def tiles(rows):
+        return [{
+            prefix + '_id': oid,
+            prefix + '_name': oname,
+            prefix + '_image_link': oimage,
+            'start_time': start_time,
+        } for oid, oname, oimage, start_time in rows]
+    details['upcoming_shows'] = tiles(upcoming)
+    details['past_shows'] = tiles(past)
+    details['upcoming_shows_count'] = len(upcoming)
+    details['past_shows_count'] = len(past)
+    return details
+
+
+def read_engine():
+    # the engine this request reads from: its replica if routing.py chose
+    # one, otherwise the primary
+    return db.session.info.get(REPLICA_KEY) or db.get_engine()
+
+
+def venue_details_parallel(venue_id, engine=None, now=None):
+    return _parallel_details(Venue, venue_id, Venue.get_json, Show.venue_id,
+                             Artist, Show.artist_id, 'artist',
+                             engine or read_engine(), now)
+
+
+def artist_details_parallel(artist_id, engine=None, now=None):
+    return _parallel_details(Artist, artist_id, Artist.info, Show.artist_id,
+                             Venue, Show.venue_id, 'venue',
+                             engine or read_engine(), now)
+
+
+def cached_venue_details(venue_id, parallel=False):
+    load = venue_details_parallel if parallel else venue_details
+    return cache.get_or_set('venue:%d' % venue_id, lambda: load(venue_id))
+
+
+def cached_artist_details(artist_id, parallel=False):
+    load = artist_details_parallel if parallel else artist_details
+    return cache.get_or_set('artist:%d' % artist_id, lambda: load(artist_id))
+
+
+def invalidate_venue(venue_id):
+    # Artist pages embed the venue's name and image, so their payloads go too.
+    artist_ids = db.session.query(Show.artist_id).filter(
+        Show.venue_id == venue_id).distinct()
+    cache.delete('venue:%d' % venue_id,
+                 *['artist:%d' % aid for (aid,) in artist_ids])
+
+
+def invalidate_artist(artist_id):
+    venue_ids = db.session.query(Show.venue_id).filter(
+        Show.artist_id == artist_id).distinct()
+    cache.delete('artist:%d' % artist_id,
+                 *['venue:%d' % vid for (vid,) in venue_ids])
+
+
+def invalidate_show(venue_id, artist_id):
+    cache.delete('venue:%d' % venue_id, 'artist:%d' % artist_id)
+
+#----------------------------------------------------------------------------#
+# Shows feed.
+#----------------------------------------------------------------------------#
+
+DEFAULT_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
+
+
+def shows_page_statement(after=None, before=None, limit=DEFAULT_PAGE_SIZE,
+                         from_view=False):
+    # Keyset pagination on (start_time, id): each page is an index range scan
+    # starting at the cursor, so deep pages cost the same as the first one.
+    # `after` and `before` are decoded cursors; `before` walks backwards.
+    # from_view reads show_listing_mv, which has the display fields joined in.
+    # One row past the limit is fetched to tell whether another page exists.
+    if from_view:
+        mv = matviews.show_listing
+        start_time, show_id = mv.c.start_time, mv.c.show_id
+        statement = select(
+            show_id, start_time, mv.c.venue_id, mv.c.venue_name,
+            mv.c.artist_id, mv.c.artist_name, mv.c.artist_image_link)
+    else:
+        start_time, show_id = Show.start_time, Show.id
+        statement = select(
+            Show.id, Show.start_time, Show.venue_id, Venue.name,
+            Show.artist_id, Artist.name, Artist.image_link
+        ).join(Venue, Venue.id == Show.venue_id).join(
+            Artist, Artist.id == Show.artist_id)
+    key = tuple_(start_time, show_id)
+    if before is not None:
+        statement = statement.where(key < tuple_(*before)).order_by(
+            start_time.desc(), show_id.desc())
+    else:
+        if after is not None:
+            statement = statement.where(key > tuple_(*after))
+        statement = statement.order_by(start_time, show_id)
+    return statement.limit(limit + 1)
+
+
+def shows_page_from(rows, after=None, before=None, limit=DEFAULT_PAGE_SIZE):
+    rows = list(rows)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+
+    shows = []
+    for sid, start_time, vid, vname, aid, aname, aimage in rows:
+        shows.append({
+            'id': sid,
+            'venue_id': vid,
+            'venue_name': vname,
+            'artist_id': aid,
+            'artist_name': aname,
+            'artist_image_link': aimage,
+            'start_time': start_time,
+        })
+
+    if before is not None:
+        has_next, has_prev = bool(rows), has_more
+    else:
+        has_next, has_prev = has_more, after is not None
+    if shows:
+        first = (shows[0]['start_time'], shows[0]['id'])
+        last = (shows[-1]['start_time'], shows[-1]['id'])
+    else:
+        # an empty page past either end still links back to where it started
+        first = last = after or before
+    return {
+        'shows': shows,
+        'limit': limit,
+        'next_cursor': encode_cursor(*last) if has_next and last else None,
+        'prev_cursor': encode_cursor(*first) if has_prev and first else None,
+    }
+
+
+def clamp_page_size(limit):
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def shows_page(after=None, before=None, limit=DEFAULT_PAGE_SIZE,
+               from_view=False):
+    limit = clamp_page_size(limit)
+    rows = db.session.execute(
+        shows_page_statement(after, before, limit, from_view))
+    return shows_page_from(rows, after, before, limit)
@@ -0,0 +1,180 @@
+import random
+import threading
+import time
+from flask import g, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, orm, text
+from sqlalchemy.pool import NullPool
+
+#----------------------------------------------------------------------------#
+# Routing session.
+#----------------------------------------------------------------------------#
+
+# Reads go to session.info['replica'] when a request put an engine there;
+# flushes, and everything in a session without one, go to the primary.
+# Keeping the choice on the session rather than in a global makes it explicit
+# for code that hands work to other threads: copy the key onto their session.
+REPLICA_KEY = 'replica'
+
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        replica = self.info.get(REPLICA_KEY)
+        if replica is not None and not self._flushing:
+            return replica
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+#----------------------------------------------------------------------------#
+# Replicas.
+#----------------------------------------------------------------------------#
+
+# 0 when fully replayed, otherwise the age of the last replayed transaction;
+# a server that is not in recovery (a plain second instance) reports 0.
+LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM
+            now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+def probe_engine(url, timeout):
+    # Unpooled, with its own short connect and statement timeouts, so a
+    # replica that stopped answering is given up on within `timeout` seconds
+    # whatever the serving engine's settings are.
+    return create_engine(url, poolclass=NullPool, connect_args={
+        'connect_timeout': timeout,
+        'options': '-c statement_timeout=%d' % (timeout * 1000)})
+
+
+class Replica(object):
+    def __init__(self, url, engine, probe):
+        self.url = url
+        self.engine = engine
+        self.probe = probe
+        self.lag = None        # seconds, None when unreachable
+        self.checked = 0.0
+
+
+class ReplicaSet(object):
+    def __init__(self, urls, engine_options, max_lag, check_interval,
+                 probe_timeout=2):
+        self.replicas = [Replica(url, create_engine(url, **engine_options),
+                                 probe_engine(url, probe_timeout))
+                         for url in urls]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+
+    def check(self, replica):
+        try:
+            with replica.probe.connect() as conn:
+                replica.lag = float(conn.execute(LAG_SQL).scalar())
+        except Exception:
+            replica.lag = None
+        replica.checked = time.monotonic()
+
+    def _due(self):
+        now = time.monotonic()
+        return [r for r in self.replicas
+                if now - r.checked >= self.check_interval]
+
+    def _probe(self):
+        try:
+            for replica in self._due():
+                self.check(replica)
+        finally:
+            self._lock.release()
+
+    def healthy(self):
+        # Lag is sampled at most once per interval per process, by one
+        # background thread at a time; requests never wait for a probe and
+        # route on the last known lag. Until the first probe has answered,
+        # reads go to the primary.
+        if self._due() and self._lock.acquire(blocking=False):
+            try:
+                threading.Thread(target=self._probe, name='replica-probe',
+                                 daemon=True).start()
+            except BaseException:
+                self._lock.release()
+                raise
+        return [r for r in self.replicas
+                if r.lag is not None and r.lag <= self.max_lag]
+
+    def choose(self):
+        healthy = self.healthy()
+        return random.choice(healthy) if healthy else None
+
+#----------------------------------------------------------------------------#
+# Flask integration.
+#----------------------------------------------------------------------------#
+
+READ_METHODS = ('GET', 'HEAD')
+
+# POST views that only read; they go to the replicas as GET views do, and as
+# the async searches in asgi.py do, and do not pin the client to the primary
+READ_ONLY_ENDPOINTS = frozenset(['main.search_venues', 'main.search_artists'])
+
+
+def read_only():
+    return request.method in READ_METHODS or \
+        request.endpoint in READ_ONLY_ENDPOINTS
+
+
+def init_app(app, db):
+    app.config.setdefault('DB_REPLICA_URLS', [])
+    app.config.setdefault('DB_STICKY_SECONDS', 5)
+    app.config.setdefault('DB_REPLICA_MAX_LAG', 5)
+    app.config.setdefault('DB_REPLICA_CHECK_INTERVAL', 5)
+    app.config.setdefault('DB_REPLICA_PROBE_TIMEOUT', 2)
+    app.config.setdefault('DB_STICKY_COOKIE', 'fyyur_primary_until')
+    if not app.config['DB_REPLICA_URLS']:
+        return None
+
+    replicas = ReplicaSet(app.config['DB_REPLICA_URLS'],
+                          app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}),
+                          app.config['DB_REPLICA_MAX_LAG'],
+                          app.config['DB_REPLICA_CHECK_INTERVAL'],
+                          app.config['DB_REPLICA_PROBE_TIMEOUT'])
+    app.extensions['fyyur_replicas'] = replicas
+    cookie = app.config['DB_STICKY_COOKIE']
+
+    def sticky():
+        # read-your-writes: a client that just wrote keeps reading from the
+        # primary until its cookie runs out
+        try:
+            return float(request.cookies.get(cookie, 0)) > time.time()
+        except ValueError:
+            return False
+
+    @app.before_request
+    def route_reads():
+        g.db_route = 'primary'
+        if not read_only() or sticky():
+            return
+        replica = replicas.choose()
+        if replica is not None:
+            db.session.info[REPLICA_KEY] = replica.engine
+            g.db_route = 'replica'
+
+    @app.after_request
+    def mark_writes(response):
+        # only a write that went through has anything to read back
+        if not read_only() and response.status_code < 400:
+            window = app.config['DB_STICKY_SECONDS']
+            response.set_cookie(cookie, '%.3f' % (time.time() + window),
+                                max_age=window, httponly=True,
+                                samesite='Lax')
+        route = g.get('db_route')
+        if route is not None:
+            response.headers['X-DB-Route'] = route
+        return response
+
+    return replicas
@@ -0,0 +1,60 @@
+from sqlalchemy import func, or_, select
+from models import db, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+DEFAULT_LIMIT = 50
+
+
+def _escape_like(term):
+    # backslash is postgres' default LIKE escape character
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_statement(model, term, limit=DEFAULT_LIMIT):
+    # A single statement matches, ranks, counts and limits. Matching uses the
+    # GIN indexes from migration 8f41d2b6c0a9: the weighted search_vector
+    # covers whole words in name/city/state/genres, while the trigram index
+    # serves substring (ILIKE) and fuzzy (%) matches on the name.
+    term = term.strip()
+    ts_query = func.plainto_tsquery('simple', term)
+    matches = or_(
+        model.search_vector.op('@@')(ts_query),
+        model.name.ilike('%' + _escape_like(term) + '%'),
+        model.name.op('%')(term),
+    )
+    rank = func.greatest(func.ts_rank(model.search_vector, ts_query),
+                         func.similarity(model.name, term))
+    return select(
+        model.id, model.name, model.upcoming_shows_count, func.count().over()
+    ).where(matches).order_by(rank.desc(), model.name).limit(limit)
+
+
+def search_results(rows):
+    rows = list(rows)
+    data = []
+    for rid, rname, upcoming, total in rows:
+        data.append({
+            'id': rid,
+            'name': rname,
+            'num_upcoming_shows': upcoming,
+        })
+    return {
+        'count': rows[0][3] if rows else 0,
+        'data': data,
+    }
+
+
+def _search(model, term, limit):
+    return search_results(db.session.execute(
+        search_statement(model, term, limit)))
+
+
+def search_venues(term, limit=DEFAULT_LIMIT):
+    return _search(Venue, term, limit)
+
+
+def search_artists(term, limit=DEFAULT_LIMIT):
+    return _search(Artist, term, limit)
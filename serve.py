@@ -0,0 +1,31 @@
+# Production entry point.
+#
+#   python serve.py wsgi [gunicorn options]   # threaded workers, app:app
+#   python serve.py asgi [gunicorn options]   # uvicorn workers, asgi.py
+#
+# Settings live in gunicorn.conf.py and follow WEB_CONCURRENCY, PORT and
+# GUNICORN_THREADS. `python app.py` is still the development server.
+import os
+import sys
+from gunicorn.app.wsgiapp import run
+
+TARGETS = {
+    'wsgi': 'app:app',
+    'asgi': 'asgi:application',
+}
+
+
+def main(argv):
+    mode = argv[0] if argv else 'wsgi'
+    if mode not in TARGETS:
+        sys.exit('usage: python serve.py [%s] [gunicorn options]' %
+                 '|'.join(sorted(TARGETS)))
+    os.environ['SERVE_MODE'] = mode
+    config = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'gunicorn.conf.py')
+    sys.argv = ['gunicorn', '-c', config] + argv[1:] + [TARGETS[mode]]
+    run()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
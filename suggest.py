@@ -0,0 +1,133 @@
+import bisect
+import threading
+import time
+from flask import current_app
+from models import db, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Typeahead index.
+#----------------------------------------------------------------------------#
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Each worker process keeps its own index; writes in one worker only update
+# that worker's copy, so every copy is rebuilt from the database this often.
+MAX_AGE = 300
+
+
+def _tokens(name):
+    # Every word-boundary suffix of the lowercased name, so "hop" and
+    # "musical h" both find "The Musical Hop".
+    words = name.lower().split()
+    return set(' '.join(words[i:]) for i in range(len(words)))
+
+
+class SuggestIndex(object):
+    def __init__(self, max_age=MAX_AGE):
+        self.max_age = max_age
+        self._keys = []   # sorted (token, kind, id)
+        self._names = {}  # (kind, id) -> name
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._building = threading.Lock()
+
+    def _insert(self, kind, entity_id, name):
+        self._names[(kind, entity_id)] = name
+        for token in _tokens(name):
+            bisect.insort(self._keys, (token, kind, entity_id))
+
+    def _delete(self, kind, entity_id):
+        name = self._names.pop((kind, entity_id), None)
+        if name is None:
+            return
+        for token in _tokens(name):
+            key = (token, kind, entity_id)
+            i = bisect.bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+
+    def load(self, entries):
+        keys = []
+        names = {}
+        for kind, entity_id, name in entries:
+            names[(kind, entity_id)] = name
+            keys.extend((token, kind, entity_id) for token in _tokens(name))
+        keys.sort()
+        with self._lock:
+            self._keys = keys
+            self._names = names
+            self._loaded_at = time.monotonic()
+
+    def load_from_db(self):
+        venues = db.session.query(Venue.id, Venue.name).all()
+        artists = db.session.query(Artist.id, Artist.name).all()
+        self.load([('venue', vid, vname) for vid, vname in venues] +
+                  [('artist', aid, aname) for aid, aname in artists])
+
+    def _ensure_loaded(self):
+        # The first build blocks, as there is nothing to answer from yet.
+        # After that a stale index is rebuilt by one background thread at a
+        # time while requests keep answering from the old one.
+        if self._loaded_at is None:
+            with self._building:
+                if self._loaded_at is None:
+                    self.load_from_db()
+        elif time.monotonic() - self._loaded_at > self.max_age and \
+                self._building.acquire(blocking=False):
+            try:
+                threading.Thread(
+                    target=self._rebuild,
+                    args=(current_app._get_current_object(),),
+                    name='suggest-rebuild', daemon=True).start()
+            except BaseException:
+                self._building.release()
+                raise
+
+    def _rebuild(self, app):
+        try:
+            with app.app_context():
+                self.load_from_db()
+        except Exception:
+            # still stale, so the next request tries again
+            app.logger.exception('suggest index rebuild failed')
+        finally:
+            self._building.release()
+
+    # Incremental updates; a no-op until the index has been built, since the
+    # first build reads the committed rows anyway.
+
+    def add(self, kind, entity_id, name):
+        with self._lock:
+            if self._loaded_at is not None:
+                self._delete(kind, entity_id)
+                self._insert(kind, entity_id, name)
+
+    def remove(self, kind, entity_id):
+        with self._lock:
+            self._delete(kind, entity_id)
+
+    def suggest(self, prefix, limit=DEFAULT_LIMIT):
+        prefix = ' '.join(prefix.lower().split())
+        if not prefix:
+            return []
+        self._ensure_loaded()
+        results = []
+        seen = set()
+        with self._lock:
+            i = bisect.bisect_left(self._keys, (prefix,))
+            while i < len(self._keys) and len(results) < limit:
+                token, kind, entity_id = self._keys[i]
+                if not token.startswith(prefix):
+                    break
+                if (kind, entity_id) not in seen:
+                    seen.add((kind, entity_id))
+                    results.append({
+                        'type': kind,
+                        'id': entity_id,
+                        'name': self._names[(kind, entity_id)],
+                    })
+                i += 1
+        return results
+
+
+index = SuggestIndex()
@@ -0,0 +1,99 @@
+import os
+from datetime import timezone
+import pytest
+from sqlalchemy import JSON, DateTime, Text, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.types import ARRAY, TypeDecorator
+
+# The suite runs against a throwaway sqlite file, so it needs no database
+# server; config.py is read with the test profile.
+os.environ.setdefault('FYYUR_ENV', 'test')
+
+
+class UTCDateTime(TypeDecorator):
+    # sqlite keeps no offset; values come back as the UTC they were stored in
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+
+
+def use_sqlite_types(metadata):
+    # the models use postgres column types; swap in sqlite equivalents
+    for table in metadata.tables.values():
+        for column in table.columns:
+            if isinstance(column.type, ARRAY):
+                column.type = JSON()
+            elif isinstance(column.type, TSVECTOR):
+                column.type = Text()
+            elif isinstance(column.type, DateTime) and column.type.timezone:
+                column.type = UTCDateTime()
+
+
+def make_config(tmp_path, **overrides):
+    import config
+    settings = dict((name, getattr(config, name)) for name in dir(config)
+                    if name.isupper())
+    settings.update({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///%s' % (tmp_path / 'fyyur.db'),
+        'SQLALCHEMY_ENGINE_OPTIONS': {},
+        'CACHE_TYPE': 'null',
+        'PAGE_CACHE_ENABLED': False,
+        'MATERIALIZED_VIEWS_ENABLED': False,
+        'DETAIL_FANOUT_ENABLED': False,
+        'DB_REPLICA_URLS': [],
+        'WARMUP_ENABLED': False,
+        'TEMPLATE_CACHE_DIR': str(tmp_path / 'templates'),
+        'IMAGE_CACHE_DIR': str(tmp_path / 'images'),
+        'WTF_CSRF_ENABLED': False,
+    })
+    settings.update(overrides)
+    return type('TestConfig', (object,), settings)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # create_app() logs to ./error.log outside debug mode
+    monkeypatch.chdir(tmp_path)
+    from app import create_app
+    from models import db
+    application = create_app(make_config(tmp_path))
+    with application.app_context():
+        use_sqlite_types(db.metadata)
+        db.create_all()
+        yield application
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def db(app):
+    from models import db
+    return db
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def statements(db):
+    # every statement sent to the database while the test runs
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    engine = db.get_engine()
+    event.listen(engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', record)
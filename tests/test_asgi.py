@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+import asgi
+from cache import cache, MemoryBackend
+from models import Venue
+
+
+class SyncSession(object):
+    # asyncpg needs PostgreSQL, so the async views' statements run on the
+    # test's sqlite session instead
+    def __init__(self, db, executed):
+        self.db = db
+        self.executed = executed
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def execute(self, statement):
+        self.executed.append(statement)
+        return self.db.session.execute(statement)
+
+
+class SyncDatabase(object):
+    replicas = None
+    primary = object()
+
+    def __init__(self, db):
+        self.db = db
+        self.executed = []
+
+    async def engine(self, sticky):
+        return self.primary
+
+    def session(self, engine):
+        return SyncSession(self.db, self.executed)
+
+
+@pytest.fixture
+def application(app, db, monkeypatch):
+    # the views render with the module's app; point them at the test one
+    monkeypatch.setattr(asgi, 'app', app)
+    application = asgi.Application(app)
+    application.db = SyncDatabase(db)
+    return application
+
+
+def call(application, method, path, body=b'', headers=()):
+    scope = {'type': 'http', 'method': method, 'path': path,
+             'query_string': b'', 'headers': list(headers)}
+    received = [{'type': 'http.request', 'body': body}]
+    sent = []
+
+    async def receive():
+        return received.pop(0)
+
+    async def send(message):
+        sent.append(message)
+    asyncio.run(application(scope, receive, send))
+    return sent[0]['status'], sent[1]['body']
+
+
+def test_detail_page_is_dispatched_and_cached(application, db, monkeypatch):
+    monkeypatch.setattr(cache, 'backend', MemoryBackend())
+    venue = Venue(name='The Musical Hop', genres=['Jazz'],
+                  city='San Francisco', state='CA',
+                  address='1015 Folsom Street')
+    db.session.add(venue)
+    db.session.commit()
+    path = '/venues/%d' % venue.id
+
+    for _ in range(2):
+        status, body = call(application, 'GET', path)
+        assert status == 200
+        assert b'The Musical Hop' in body
+    # the second request was answered from the payload cache
+    assert len(application.db.executed) == 1
+    metrics = application.app.extensions['metrics']
+    assert metrics.requests_total._values[('main.show_venue', 'GET',
+                                           200)] == 2
+
+
+def test_undecodable_form_body_is_a_bad_request(application):
+    status, body = call(application, 'POST', '/venues/search',
+                        body=b'search_term=\xff\xfe', headers=[
+                            (b'content-type',
+                             b'application/x-www-form-urlencoded')])
+    assert status == 400
+    assert application.db.executed == []
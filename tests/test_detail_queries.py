@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy.exc import SQLAlchemyError
+from cache import cache, MemoryBackend
+from models import Artist, Show, Venue
+
+
+@pytest.fixture
+def listing(db):
+    # one venue and one artist sharing past and upcoming shows, so a page
+    # that loaded shows or their counterparts lazily would issue more queries
+    venue = Venue(name='The Musical Hop', genres=['Jazz'], city='San Francisco',
+                  state='CA', address='1015 Folsom Street')
+    artist = Artist(name='Guns N Petals', genres=['Rock n Roll'],
+                    city='San Francisco', state='CA', phone=None,
+                    image_link=None, website=None, facebook_link=None)
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    now = datetime.now(timezone.utc)
+    db.session.add_all([
+        Show(venue_id=venue.id, artist_id=artist.id,
+             start_time=now + timedelta(days=days))
+        for days in (-30, -1, 1, 30)])
+    db.session.commit()
+    ids = venue.id, artist.id
+    # a fresh request starts from an empty identity map
+    db.session.remove()
+    return ids
+
+
+def test_venue_page_is_one_query(client, listing, statements):
+    response = client.get('/venues/%d' % listing[0])
+    assert response.status_code == 200
+    assert b'Guns N Petals' in response.data
+    assert len(statements) == 1, statements
+
+
+def test_artist_page_is_one_query(client, listing, statements):
+    response = client.get('/artists/%d' % listing[1])
+    assert response.status_code == 200
+    assert b'The Musical Hop' in response.data
+    assert len(statements) == 1, statements
+
+
+def test_shows_page_is_one_query(client, listing, statements):
+    response = client.get('/shows')
+    assert response.status_code == 200
+    assert response.data.count(b'Guns N Petals') == 4
+    assert len(statements) == 1, statements
+
+
+def test_unknown_venue_is_one_query(client, listing, statements):
+    response = client.get('/venues/%d' % (listing[0] + 1))
+    assert response.status_code == 404
+    assert len(statements) == 1, statements
+
+
+def test_delete_venue_drops_payload_after_commit(client, db, listing,
+                                                 monkeypatch):
+    monkeypatch.setattr(cache, 'backend', MemoryBackend())
+    key = 'venue:%d' % listing[0]
+    cache.set(key, {'name': 'The Musical Hop'})
+
+    def fail():
+        raise SQLAlchemyError('commit failed')
+    with monkeypatch.context() as patch:
+        patch.setattr(db.session, 'commit', fail)
+        response = client.delete('/venues/%d' % listing[0])
+    assert response.get_json() == {'success': False}
+    # the venue is still there, so its payload is still good
+    assert cache.get(key) is not None
+
+    # shows reference the venue and nothing cascades
+    Show.query.delete()
+    db.session.commit()
+    response = client.delete('/venues/%d' % listing[0])
+    assert response.get_json() == {'success': True}
+    assert cache.get(key) is None
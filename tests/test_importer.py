@@ -0,0 +1,70 @@
+import json
+import pytest
+from importer import import_rows, read_rows
+from models import Venue
+
+
+@pytest.fixture
+def write_rows(tmp_path):
+    def write(lines, name='rows.jsonl'):
+        path = tmp_path / name
+        path.write_text(''.join(line + '\n' for line in lines))
+        return str(path)
+    return write
+
+
+def venue(**values):
+    row = {'name': 'The Dueling Pianos Bar', 'city': 'New York',
+           'state': 'NY', 'address': '335 Delancey Street',
+           'genres': ['Classical', 'R&B']}
+    row.update(values)
+    return json.dumps(row)
+
+
+def run_import(app, path, chunk_size=1000):
+    with app.test_request_context():
+        return import_rows('venues', read_rows(path), chunk_size)
+
+
+def test_unparseable_lines_are_rejected_with_their_line(app, write_rows):
+    path = write_rows([venue(name='First'), '{"name": "Second", ', '',
+                       '["not", "an", "object"]', venue(name='Third')])
+    stats = run_import(app, path)
+    assert stats['loaded'] == 2
+    assert [number for number, _ in stats['rejected']] == [2, 4]
+    assert all(list(errors) == ['json'] for _, errors in stats['rejected'])
+    assert sorted(v.name for v in Venue.query) == ['First', 'Third']
+
+
+def test_rows_with_different_optional_fields_keep_their_values(
+        app, db, write_rows, statements):
+    # blank optional fields are left out by validate(), so the rows of one
+    # chunk carry different keys
+    path = write_rows([
+        venue(name='Bare'),
+        venue(name='With website', website='https://example.com'),
+        venue(name='With phone', phone='326-123-5000',
+              seeking_talent=False),
+        venue(name='Everything', website='https://example.org',
+              phone='914-003-1132', image_link='https://example.org/a.jpg',
+              facebook_link='https://www.facebook.com/x',
+              seeking_description='Looking for jazz'),
+    ])
+    stats = run_import(app, path)
+    assert stats['loaded'] == 4
+    assert stats['rejected'] == []
+    inserts = [s for s in statements if s.startswith('INSERT')]
+    assert len(inserts) == 1, inserts
+
+    stored = dict((v.name, v) for v in Venue.query)
+    assert stored['Bare'].website is None
+    assert stored['Bare'].phone is None
+    assert stored['Bare'].seeking_talent is False
+    assert stored['With website'].website == 'https://example.com'
+    assert stored['With website'].phone is None
+    assert stored['With phone'].phone == '326-123-5000'
+    assert stored['With phone'].seeking_talent is False
+    assert stored['Everything'].website == 'https://example.org'
+    assert stored['Everything'].image_link == 'https://example.org/a.jpg'
+    assert stored['Everything'].seeking_description == 'Looking for jazz'
+    assert stored['Everything'].genres == ['Classical', 'R&B']
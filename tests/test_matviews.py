@@ -0,0 +1,69 @@
+import threading
+import matviews
+import page_cache
+from cache import cache, MemoryBackend
+from conftest import make_config, use_sqlite_types
+
+
+def test_refresh_bumps_the_page_version(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from app import create_app
+    app = create_app(make_config(tmp_path, CACHE_TYPE='memory'))
+    assert isinstance(cache.backend, MemoryBackend)
+    monkeypatch.setattr(matviews, 'refresh', lambda engine: {'view': 0.0})
+    with app.app_context():
+        before = page_cache.data_version()
+
+    # the refresher runs on a timer thread, outside any app context
+    refresher = matviews.Refresher(app, engine=None, delay=0)
+    errors = []
+    monkeypatch.setattr(app.logger, 'exception', errors.append)
+
+    def run():
+        try:
+            refresher._run()
+        except Exception as error:
+            errors.append(error)
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+
+    assert errors == []
+    with app.app_context():
+        after = page_cache.data_version()
+    assert after[0] == before[0] + 1
+    assert after[1] > before[1]
+
+
+def test_only_successful_writes_request_a_refresh(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from app import create_app
+    from models import db
+    import search
+    app = create_app(make_config(tmp_path, MATERIALIZED_VIEWS_ENABLED=True))
+    requested = []
+    monkeypatch.setattr(app.extensions['matviews'], 'request',
+                        lambda: requested.append(True))
+    # the full-text half of the search is postgres-only
+    monkeypatch.setattr(search, 'search_venues',
+                        lambda term: search.search_results([]))
+    client = app.test_client()
+    with app.app_context():
+        use_sqlite_types(db.metadata)
+        db.create_all()
+        try:
+            response = client.post('/venues/search',
+                                   data={'search_term': 'hop'})
+            assert response.status_code == 200
+            assert requested == []
+
+            response = client.post('/venues/create', data={
+                'name': 'The Musical Hop', 'city': 'San Francisco',
+                'state': 'CA', 'phone': '', 'address': '1015 Folsom Street',
+                'genres': ['Jazz'], 'image_link': '', 'website': '',
+                'facebook_link': ''})
+            assert response.status_code == 200
+            assert requested == [True]
+        finally:
+            db.session.remove()
+            db.drop_all()
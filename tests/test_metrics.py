@@ -0,0 +1,25 @@
+from sqlalchemy.pool import QueuePool
+from conftest import make_config
+
+
+def test_pool_gauges_per_engine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from app import create_app
+    from models import db
+    replica = 'sqlite:///%s' % (tmp_path / 'replica.db')
+    app = create_app(make_config(
+        tmp_path, DB_REPLICA_URLS=[replica],
+        SQLALCHEMY_ENGINE_OPTIONS={'poolclass': QueuePool, 'pool_size': 2,
+                                   'max_overflow': 1}))
+    registry = app.extensions['metrics'].registry
+    with app.app_context():
+        engine = db.get_engine()
+    with engine.connect():
+        lines = registry.render().splitlines()
+
+    assert 'fyyur_db_pool_size{engine="primary"} 2.0' in lines
+    assert 'fyyur_db_pool_size{engine="%s"} 2.0' % replica in lines
+    assert 'fyyur_db_pool_checkedout{engine="primary"} 1.0' in lines
+    # below pool_size QueuePool reports a negative overflow
+    assert 'fyyur_db_pool_overflow{engine="primary"} 0.0' in lines
+    assert 'fyyur_db_pool_overflow{engine="%s"} 0.0' % replica in lines
@@ -0,0 +1,33 @@
+import pytest
+from cache import cache, MemoryBackend
+from conftest import make_config, use_sqlite_types
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from app import create_app
+    from models import db
+    app = create_app(make_config(tmp_path, CACHE_TYPE='memory',
+                                 PAGE_CACHE_ENABLED=True))
+    assert isinstance(cache.backend, MemoryBackend)
+    with app.app_context():
+        use_sqlite_types(db.metadata)
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+        db.drop_all()
+
+
+def test_cached_pages_vary_on_locale_and_timezone(client):
+    response = client.get('/shows')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert 'Accept-Language' in response.vary
+    assert 'Cookie' in response.vary
+
+    etag = response.headers['ETag']
+    response = client.get('/shows', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert 'Accept-Language' in response.vary
+    assert 'Cookie' in response.vary
@@ -0,0 +1,94 @@
+import time
+import pytest
+from sqlalchemy import create_engine
+import search
+from conftest import make_config, use_sqlite_types
+from models import Venue
+
+VENUE = {'name': 'The Musical Hop', 'city': 'San Francisco', 'state': 'CA',
+         'phone': '', 'address': '1015 Folsom Street', 'genres': ['Jazz'],
+         'image_link': '', 'website': '', 'facebook_link': ''}
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # a second sqlite file stands in for the replica; each holds one venue
+    # under a different name, so a page shows which database it came from
+    monkeypatch.chdir(tmp_path)
+    from app import create_app
+    from models import db
+    replica_url = 'sqlite:///%s' % (tmp_path / 'replica.db')
+    application = create_app(make_config(
+        tmp_path, DB_REPLICA_URLS=[replica_url],
+        DB_REPLICA_CHECK_INTERVAL=3600))
+    # requests below run outside this context, as they would when served,
+    # so each one starts a fresh session
+    with application.app_context():
+        use_sqlite_types(db.metadata)
+        db.create_all()
+        replica_engine = create_engine(replica_url)
+        db.metadata.create_all(replica_engine)
+        db.session.add(Venue(id=1, name='Primary Hall', genres=['Jazz'],
+                             city='Austin', state='TX', address='1 Main St'))
+        db.session.commit()
+        with replica_engine.begin() as conn:
+            conn.execute(Venue.__table__.insert(), {
+                'id': 1, 'name': 'Replica Hall', 'genres': ['Jazz'],
+                'city': 'Austin', 'state': 'TX', 'address': '1 Main St'})
+        replica_engine.dispose()
+    yield application
+    with application.app_context():
+        db.drop_all()
+
+
+@pytest.fixture
+def replica(app):
+    # healthy and checked just now; the lag probe is postgres-only
+    replica = app.extensions['fyyur_replicas'].replicas[0]
+    replica.lag = 0.0
+    replica.checked = time.monotonic()
+    return replica
+
+
+def test_reads_go_to_a_healthy_replica(app, replica):
+    response = app.test_client().get('/venues/1')
+    assert response.headers['X-DB-Route'] == 'replica'
+    assert b'Replica Hall' in response.data
+
+
+def test_lagging_replica_falls_back_to_primary(app, replica):
+    replica.lag = app.config['DB_REPLICA_MAX_LAG'] + 1
+    response = app.test_client().get('/venues/1')
+    assert response.headers['X-DB-Route'] == 'primary'
+    assert b'Primary Hall' in response.data
+
+
+def test_searches_read_from_replica_and_stay_unpinned(app, replica,
+                                                      monkeypatch):
+    # the full-text half of the search is postgres-only
+    monkeypatch.setattr(search, 'search_venues',
+                        lambda term: search.search_results([]))
+    client = app.test_client()
+    response = client.post('/venues/search', data={'search_term': 'hall'})
+    assert response.status_code == 200
+    assert response.headers['X-DB-Route'] == 'replica'
+    assert 'Set-Cookie' not in response.headers
+
+
+def test_successful_write_pins_client_to_primary(app, replica):
+    cookie = app.config['DB_STICKY_COOKIE']
+    client = app.test_client()
+
+    # missing form fields: nothing was written
+    response = client.post('/venues/create', data={'city': 'Austin'})
+    assert response.status_code == 400
+    assert 'Set-Cookie' not in response.headers
+    assert client.get('/venues/1').headers['X-DB-Route'] == 'replica'
+
+    response = client.post('/venues/create', data=VENUE)
+    assert response.status_code == 200
+    assert response.headers['X-DB-Route'] == 'primary'
+    assert cookie in response.headers['Set-Cookie']
+    response = client.get('/venues/1')
+    assert response.headers['X-DB-Route'] == 'primary'
+    assert b'Primary Hall' in response.data
@@ -0,0 +1,32 @@
+import threading
+import time
+from suggest import SuggestIndex
+
+
+def test_stale_index_answers_while_it_rebuilds(app):
+    index = SuggestIndex(max_age=60)
+    index.load([('venue', 1, 'The Musical Hop')])
+    index._loaded_at = time.monotonic() - 61
+
+    started = threading.Event()
+    release = threading.Event()
+    rebuilt = threading.Event()
+    loads = []
+
+    def load_from_db():
+        loads.append(threading.current_thread().name)
+        started.set()
+        release.wait(5)
+        index.load([('venue', 1, 'The Musical Hop'),
+                    ('venue', 2, 'Park Square Live Music & Coffee')])
+        rebuilt.set()
+    index.load_from_db = load_from_db
+
+    # both answer from the old index; only the first starts a rebuild
+    assert [r['id'] for r in index.suggest('mus')] == [1]
+    assert started.wait(5)
+    assert [r['id'] for r in index.suggest('mus')] == [1]
+    release.set()
+    assert rebuilt.wait(5)
+    assert loads == ['suggest-rebuild']
+    assert sorted(r['id'] for r in index.suggest('mus')) == [1, 2]
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import time
+import click
+from flask.cli import with_appcontext
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy.exc import SQLAlchemyError
+
+#----------------------------------------------------------------------------#
+# Template bytecode cache.
+#----------------------------------------------------------------------------#
+
+
+class SharedBytecodeCache(FileSystemBytecodeCache):
+    # Every worker reads and writes the same directory. Jinja writes the
+    # cache file in place, so a worker could load another's half-written
+    # file; writing to a temporary file and renaming it over makes each
+    # update atomic.
+    def dump_bytecode(self, bucket):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                bucket.write_bytecode(f)
+            os.replace(tmp, self._get_cache_filename(bucket))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+def template_names(app):
+    return sorted(name for name in app.jinja_env.list_templates()
+                  if name.endswith('.html'))
+
+
+def compile_templates(app):
+    # Loading a template compiles it, stores it in the environment's
+    # in-memory cache and, with a bytecode cache set, writes it to disk.
+    start = time.perf_counter()
+    names = template_names(app)
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names, time.perf_counter() - start
+
+#----------------------------------------------------------------------------#
+# Warm-up.
+#----------------------------------------------------------------------------#
+
+
+def configure_mappers(db):
+    start = time.perf_counter()
+    db.configure_mappers()
+    return time.perf_counter() - start
+
+
+def prime_pool(app, db, count=None):
+    # Holds `count` connections open together, so the pool really grows to
+    # that many, then returns them; the first requests find them connected.
+    # A database that is down is logged rather than raised; the worker can
+    # still start.
+    count = app.config['WARMUP_CONNECTIONS'] if count is None else count
+    if count <= 0:
+        return 0
+    with app.app_context():
+        engine = db.get_engine()
+    if hasattr(engine.pool, 'size'):
+        count = min(count, engine.pool.size())
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(engine.connect())
+    except SQLAlchemyError as e:
+        app.logger.warning('pool warm-up stopped after %d connections: %s'
+                           % (len(connections), e))
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+
+def warm(app, db):
+    # Process-wide work only: safe to run before gunicorn forks, so every
+    # worker inherits compiled templates and configured mappers.
+    mappers = configure_mappers(db)
+    names, compiled = compile_templates(app)
+    app.logger.info('warm-up: mappers in %.1fms, %d templates in %.1fms' % (
+        mappers * 1000, len(names), compiled * 1000))
+
+#----------------------------------------------------------------------------#
+# Flask integration.
+#----------------------------------------------------------------------------#
+
+
+def init_app(app, db):
+    app.config.setdefault('TEMPLATE_CACHE_DIR', None)
+    app.config.setdefault('WARMUP_ENABLED', False)
+    app.config.setdefault('WARMUP_CONNECTIONS', 0)
+    directory = app.config['TEMPLATE_CACHE_DIR']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = SharedBytecodeCache(directory)
+
+    if app.config['WARMUP_ENABLED']:
+        warm(app, db)
+
+    @app.cli.group('templates')
+    def templates_command():
+        """Manage compiled templates."""
+
+    @templates_command.command('precompile')
+    @with_appcontext
+    def precompile_command():
+        """Compile every template into the bytecode cache; run at build."""
+        if app.jinja_env.bytecode_cache is None:
+            raise click.UsageError('TEMPLATE_CACHE_DIR is not set')
+        # a fresh build replaces whatever an older release left behind, and
+        # templates already loaded in memory would not be written again
+        app.jinja_env.bytecode_cache.clear()
+        if app.jinja_env.cache is not None:
+            app.jinja_env.cache.clear()
+        names, elapsed = compile_templates(app)
+        click.echo('compiled %d templates into %s in %.1fms' % (
+            len(names), directory, elapsed * 1000))